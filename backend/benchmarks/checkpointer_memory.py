@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for the conversation checkpointer.
+
+Simulates thousands of chat threads (each turn optionally carrying a fake
+base64 receipt image) through a minimal LangGraph graph and compares the
+unbounded InMemorySaver with the bounded SQLite saver. No LLM or Supabase
+access is needed.
+
+Usage:
+    python benchmarks/checkpointer_memory.py --threads 5000 --turns 10 --image-kb 200
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+from typing_extensions import Annotated, TypedDict
+
+from checkpointer import BoundedSqliteSaver
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+def echo(state: State):
+    return {"messages": [AIMessage(content=f"Recorded: {len(state['messages'])} messages so far")]}
+
+
+def build_graph(checkpointer):
+    builder = StateGraph(State)
+    builder.add_node("assistant", echo)
+    builder.add_edge(START, "assistant")
+    builder.add_edge("assistant", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+def run(name, checkpointer, threads, turns, image_kb):
+    graph = build_graph(checkpointer)
+    image = "A" * (image_kb * 1024)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for turn in range(turns):
+        for thread in range(threads):
+            content = [
+                {"type": "text", "text": f"Receipt {turn} for thread {thread}"},
+                {"type": "image_url", "image_url": f"data:image/jpeg;base64,{image}"},
+            ] if image_kb else f"Message {turn} for thread {thread}"
+            graph.invoke(
+                {"messages": [HumanMessage(content=content)]},
+                {"configurable": {"thread_id": f"thread_{thread}"}},
+            )
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"\n=== {name} ===")
+    print(f"Turns executed:      {threads * turns}")
+    print(f"Elapsed:             {elapsed:.1f}s ({elapsed / (threads * turns) * 1000:.2f}ms per turn)")
+    print(f"Python heap (now):   {current / 1024 / 1024:.1f} MB")
+    print(f"Python heap (peak):  {peak / 1024 / 1024:.1f} MB")
+    if isinstance(checkpointer, BoundedSqliteSaver):
+        print(f"SQLite file:         {os.path.getsize(checkpointer.path) / 1024 / 1024:.1f} MB")
+        print(f"Saver stats:         {checkpointer.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checkpointer memory benchmark")
+    parser.add_argument("--threads", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--image-kb", type=int, default=0, help="Size of a fake image attached to each turn")
+    parser.add_argument("--max-threads", type=int, default=1000, help="Thread cap for the bounded saver")
+    parser.add_argument("--skip-memory", action="store_true", help="Only run the bounded saver")
+    args = parser.parse_args()
+
+    if not args.skip_memory:
+        run("InMemorySaver", InMemorySaver(), args.threads, args.turns, args.image_kb)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        saver = BoundedSqliteSaver(
+            os.path.join(tmp, "bench.sqlite"),
+            max_messages=20,
+            max_bytes=512 * 1024,
+            max_threads=args.max_threads,
+        )
+        run("BoundedSqliteSaver", saver, args.threads, args.turns, args.image_kb)
+        saver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for /chat/stream.
+
+Opens N chat streams in parallel against a running backend and polls /health
+while they are in flight. With the async graph path the wall time should be
+close to the slowest single stream, not the sum of all streams, and /health
+should keep answering in milliseconds.
+
+Each stream needs its own user: requests on one user's conversation thread
+are serialized, and new_thread clears the history another stream is using.
+Pass at least as many --email addresses as --streams; streams beyond that
+reuse an address and are reported as serialized.
+
+Usage:
+    python benchmarks/concurrent_streams.py --url http://localhost:8000 --streams 4 \
+        --email a@example.com b@example.com c@example.com d@example.com
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+
+async def run_stream(client, url, email, message, index):
+    """Run one chat stream and return (index, seconds, event types)"""
+    payload = {
+        "message": message,
+        "conversation_history": [],
+        "user_email": email,
+        "new_thread": True,
+    }
+    event_types = []
+    start = time.perf_counter()
+    async with client.stream("POST", f"{url}/chat/stream", json=payload) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                event_types.append(json.loads(line[6:]).get("type"))
+    return index, time.perf_counter() - start, event_types
+
+
+async def poll_health(client, url, stop):
+    """Measure /health latency until the streams are finished"""
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get(f"{url}/health")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.1)
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Parallel /chat/stream benchmark")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument("--email", nargs="+", required=True, help="existing users, one per stream")
+    parser.add_argument("--message", default="How much did I spend on coffee last month?")
+    args = parser.parse_args()
+
+    emails = [args.email[i % len(args.email)] for i in range(args.streams)]
+    if len(args.email) < args.streams:
+        print(f"Only {len(args.email)} users for {args.streams} streams: streams sharing a user run one after another")
+
+    async with httpx.AsyncClient(timeout=None) as client:
+        stop = asyncio.Event()
+        health_task = asyncio.create_task(poll_health(client, args.url, stop))
+
+        wall_start = time.perf_counter()
+        results = await asyncio.gather(*[
+            run_stream(client, args.url, email, args.message, i)
+            for i, email in enumerate(emails)
+        ])
+        wall = time.perf_counter() - wall_start
+
+        stop.set()
+        health = await health_task
+
+    durations = [seconds for _, seconds, _ in results]
+    print("\n=== Concurrent stream benchmark ===")
+    for index, seconds, event_types in sorted(results):
+        print(f"Stream {index}: {seconds:.2f}s events={event_types}")
+    print(f"\nWall time:        {wall:.2f}s")
+    print(f"Slowest stream:   {max(durations):.2f}s")
+    print(f"Sum of streams:   {sum(durations):.2f}s")
+    print(f"Overlap factor:   {sum(durations) / wall:.1f}x (ideal = {min(args.streams, len(args.email))}x)")
+    if health:
+        print(f"/health latency:  max {max(health) * 1000:.1f}ms over {len(health)} probes")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
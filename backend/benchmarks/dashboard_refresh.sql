@@ -0,0 +1,73 @@
+-- Write latency of the jar dashboard maintenance as the transactions table grows.
+--
+-- Run against a scratch database that has new_accumulative_db_schema.sql loaded
+-- (it inserts users, jars and millions of transactions):
+--     psql -d scratch -v max_rows=10000000 -f backend/benchmarks/dashboard_refresh.sql
+--
+-- The table grows the way production does, by adding users (up to 10,000 users
+-- with 1,000 transactions each). For each size it reports the average time of a
+-- single-row chatbot insert (incremental triggers) and of one full
+-- refresh_jar_dashboard_data(), which is what every write cost when the
+-- triggers rebuilt all users' rows.
+
+\set ON_ERROR_STOP on
+\if :{?max_rows}
+\else
+  \set max_rows 10000000
+\endif
+SELECT set_config('bench.max_rows', :'max_rows', false) AS bench_max_rows \gset
+
+INSERT INTO public.jar_categories (id, name, description)
+SELECT i, (ARRAY['Necessity', 'Play', 'Education', 'Investment', 'Charity', 'Savings'])[i], 'benchmark'
+FROM generate_series(1, 6) i
+ON CONFLICT DO NOTHING;
+
+INSERT INTO public.users (id, email)
+SELECT u, 'bench' || u || '@example.com' FROM generate_series(1, 10000) u
+ON CONFLICT DO NOTHING;
+
+INSERT INTO public.user_jars (user_id, category_id)
+SELECT u, c FROM generate_series(1, 10000) u, generate_series(1, 6) c
+ON CONFLICT DO NOTHING;
+
+DO $$
+DECLARE
+  v_sizes bigint[] := ARRAY[10000, 100000, 1000000, 10000000];
+  v_max bigint := current_setting('bench.max_rows')::bigint;
+  v_size bigint;
+  v_have bigint;
+  v_start timestamptz;
+  v_write_ms numeric;
+  v_full_ms numeric;
+  v_writes integer := 20;
+BEGIN
+  RAISE NOTICE '%', rpad('transactions', 14) || rpad('incremental write', 20) || 'full refresh (old per-write cost)';
+  FOREACH v_size IN ARRAY v_sizes LOOP
+    EXIT WHEN v_size > v_max;
+
+    -- Grow the table with the triggers off, then bring the derived tables in line once
+    SELECT COUNT(*) INTO v_have FROM public.transactions;
+    ALTER TABLE public.transactions DISABLE TRIGGER USER;
+    INSERT INTO public.transactions (user_id, jar_category_id, amount_cents, occurred_at, description, source)
+    SELECT 1 + ((i - 1) / 1000) % 10000, 1 + (i % 6), CASE WHEN i % 10 = 0 THEN 5000000 ELSE -(i % 200000) END,
+           LOCALTIMESTAMP - (i % 1000) * interval '1 day', 'benchmark', 'benchmark'
+    FROM generate_series(v_have + 1, v_size) i;
+    ALTER TABLE public.transactions ENABLE TRIGGER USER;
+    ANALYZE public.transactions;
+
+    v_start := clock_timestamp();
+    PERFORM refresh_jar_dashboard_data();
+    v_full_ms := extract(epoch FROM clock_timestamp() - v_start) * 1000;
+
+    -- Single-row inserts, as update_transaction sends them
+    v_start := clock_timestamp();
+    FOR i IN 1..v_writes LOOP
+      INSERT INTO public.transactions (user_id, jar_category_id, amount_cents, description, source)
+      VALUES (1 + (i % 10), 1 + (i % 6), -25000, 'benchmark write', 'benchmark');
+    END LOOP;
+    v_write_ms := extract(epoch FROM clock_timestamp() - v_start) * 1000 / v_writes;
+
+    RAISE NOTICE '%', rpad(v_size::text, 14) || rpad(round(v_write_ms, 2)::text || ' ms', 20) || round(v_full_ms, 1)::text || ' ms';
+  END LOOP;
+END;
+$$;
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the chat image pipeline on phone-sized receipt photos.
+
+Builds synthetic receipt photos the size phones produce (12 MP 4032x3024
+and 48 MP 8064x6048 JPEGs with an EXIF rotation flag, paper, printed
+lines and sensor noise) and runs them through
+images.ImagePipeline. Reports, per photo, the upload and processed sizes,
+Gemini image tokens, processing time and peak decoded memory, plus the
+bytes one image adds to every later prompt and to the stored history
+before and after it is replaced by a reference.
+
+Usage:
+    python benchmarks/image_pipeline.py --runs 5
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from images import ImagePipeline, gemini_image_tokens, image_reference
+
+PHOTOS = {
+    "12MP": (4032, 3024),
+    "48MP": (8064, 6048),
+}
+
+
+def receipt_photo(size, seed=3):
+    """Landscape sensor image of a receipt on a table, tagged as rotated 90°"""
+    rnd = random.Random(seed)
+    width, height = size
+    photo = Image.new("RGB", size, (118, 92, 70))
+    draw = ImageDraw.Draw(photo)
+    paper = (int(width * 0.25), int(height * 0.05), int(width * 0.75), int(height * 0.95))
+    draw.rectangle(paper, fill=(244, 242, 236))
+    line_height = max(12, height // 60)
+    for y in range(paper[1] + line_height, paper[3] - line_height, line_height * 2):
+        x = paper[0] + line_height
+        while x < paper[2] - line_height * 4:
+            word = rnd.randint(line_height, line_height * 5)
+            draw.rectangle((x, y, min(x + word, paper[2] - line_height), y + line_height), fill=(40, 40, 40))
+            x += word + line_height
+    noise = Image.effect_noise(size, 18).convert("RGB")
+    photo = Image.blend(photo, noise, 0.12).filter(ImageFilter.GaussianBlur(1))
+    exif = photo.getexif()
+    exif[0x0112] = 6  # rotate 90° when displayed, as phones do for portrait shots
+    out = BytesIO()
+    photo.save(out, format="JPEG", quality=92, exif=exif)
+    return base64.b64encode(out.getvalue()).decode("ascii")
+
+
+def history_bytes(content):
+    return len(json.dumps(content))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image pipeline benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print("\n=== Image pipeline ===")
+    print(f"{'photo':6s} {'upload':>9s} {'sent':>9s} {'size':>11s} {'tokens':>14s} {'time':>9s} {'decoded':>17s}")
+    for name, size in PHOTOS.items():
+        upload = receipt_photo(size)
+        timings = []
+        for _ in range(args.runs):
+            pipeline = ImagePipeline()
+            start = time.perf_counter()
+            prepared = pipeline.prepare(upload)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+
+        with Image.open(BytesIO(base64.b64decode(upload))) as image:
+            full_decode = image.width * image.height * 3
+            scale = pipeline.max_side / max(image.size)
+            image.draft("RGB", (round(image.width * scale), round(image.height * scale)))
+            draft_decode = image.size[0] * image.size[1] * 3
+
+        start = time.perf_counter()
+        again = pipeline.prepare(upload)
+        repeat_ms = (time.perf_counter() - start) * 1000
+        assert again is prepared
+
+        print(f"{name:6s} {len(upload) / 1e6:7.2f}MB {len(prepared.data_url) / 1e6:7.2f}MB "
+              f"{prepared.width:5d}x{prepared.height:<5d} "
+              f"{gemini_image_tokens(*size):6d}->{prepared.tokens:<6d} "
+              f"{timings[len(timings) // 2] * 1000:7.0f}ms "
+              f"{full_decode / 1e6:6.1f}->{draft_decode / 1e6:5.1f}MB")
+
+        text = {"type": "text", "text": "How much did I spend on this receipt?"}
+        before = history_bytes([text, {"type": "image_url", "image_url": "data:image/jpeg;base64," + upload}])
+        sent = history_bytes([text, {"type": "image_url", "image_url": prepared.data_url}])
+        after = history_bytes([text, image_reference(prepared)])
+        print(f"       stored per image: {before / 1e6:.2f}MB raw, {sent / 1e6:.2f}MB processed, "
+              f"{after} bytes after the turn; repeat upload {repeat_ms:.2f}ms (deduplicated)")
+    print("Portrait orientation applied:", prepared.height > prepared.width)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark for running the tool calls of one assistant step in parallel.
+
+Sends one AIMessage with several tool calls (blocking stand-ins for
+sql_executor, search_web and a few update_transaction calls, one of which
+fails) through the old single fallback-wrapped ToolNode and through
+tool_node.ParallelToolNode at several concurrency limits. With a limit of
+1 the step takes the sum of the tools; with enough room it should take
+about as long as the slowest one. The failing call must not take the
+other results down with it, as it does with the single ToolNode.
+
+Usage:
+    python benchmarks/parallel_tools.py --concurrency 4 --items 4
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from typing_extensions import Annotated, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+
+from tool_node import ParallelToolNode, create_tool_node_with_fallback
+
+
+@tool
+def sql_executor(sql_query: str) -> str:
+    """Run a query (stand-in: 400 ms database round-trip)"""
+    time.sleep(0.4)
+    return f"3 rows for {sql_query}"
+
+
+@tool
+def search_web(query: str) -> str:
+    """Search the web (stand-in: 700 ms provider call)"""
+    time.sleep(0.7)
+    return f"results for {query}"
+
+
+@tool
+def update_transaction(amount: float, description: str) -> str:
+    """Record one receipt item (stand-in: 250 ms insert, negative amounts fail)"""
+    time.sleep(0.25)
+    if amount < 0:
+        raise ValueError(f"Invalid amount for {description}")
+    return f"Recorded {description}: {amount:,.0f} VND"
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+    user_email: str
+
+
+TOOLS = [sql_executor, search_web, update_transaction]
+SLEEPS = {"sql_executor": 0.4, "search_web": 0.7, "update_transaction": 0.25}
+
+
+def step_state(items: int) -> dict:
+    calls = [
+        {"name": "sql_executor", "args": {"sql_query": "SELECT 1"}, "id": "call_sql"},
+        {"name": "search_web", "args": {"query": "gold price"}, "id": "call_search"},
+    ]
+    for i in range(items):
+        amount = -1 if i == 1 else 10000 * (i + 1)
+        calls.append({"name": "update_transaction", "args": {"amount": amount, "description": f"item {i}"},
+                      "id": f"call_item_{i}"})
+    return {"messages": [HumanMessage(content="receipt"), AIMessage(content="", tool_calls=calls)], "user_email": "u@x.com"}
+
+
+def tools_graph(node):
+    """The tools node on its own, as the chat graph runs it"""
+    builder = StateGraph(State)
+    builder.add_node("tools", node)
+    builder.add_edge(START, "tools")
+    builder.add_edge("tools", END)
+    return builder.compile()
+
+
+async def timed(graph, state):
+    start = time.perf_counter()
+    output = await graph.ainvoke(state)
+    results = {m.tool_call_id: m.content for m in output["messages"] if isinstance(m, ToolMessage)}
+    return time.perf_counter() - start, results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Parallel tool call benchmark")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--items", type=int, default=4)
+    args = parser.parse_args()
+
+    state = step_state(args.items)
+    calls = state["messages"][-1].tool_calls
+    total = sum(SLEEPS[call["name"]] for call in calls)
+    slowest = max(SLEEPS[call["name"]] for call in calls)
+
+    serial_node = tools_graph(create_tool_node_with_fallback(TOOLS))
+    serial_state = step_state(args.items)
+    serial_state["messages"][-1].tool_calls = [c for c in calls if c["args"].get("amount", 1) >= 0]
+    serial_s, _ = await timed(serial_node, serial_state)
+    _, failed = await timed(serial_node, state)
+
+    print(f"\n=== One step with {len(calls)} tool calls (sum {total:.2f}s, slowest {slowest:.2f}s) ===")
+    print(f"Single ToolNode, all calls succeed: {serial_s:.2f}s (no limit)")
+    ok_before = sum(not text.startswith("Invalid") for text in failed.values())
+    print(f"Single ToolNode, one call fails:    {ok_before}/{len(calls)} results kept")
+
+    for limit in sorted({1, 2, args.concurrency}):
+        parallel_graph = tools_graph(ParallelToolNode(TOOLS, concurrency=limit).as_runnable())
+        parallel_s, results = await timed(parallel_graph, state)
+        ok_after = sum(not text.startswith("Invalid") for text in results.values())
+        print(f"ParallelToolNode, limit {limit}:         {parallel_s:.2f}s, {ok_after}/{len(calls)} results kept")
+    for call in calls:
+        print(f"  {call['id']:13s} {results[call['id']][:60]}")
+
+    isolated = ok_after == len(calls) - 1 and list(results) == [call["id"] for call in calls]
+    print("OK" if isolated else "FAILED")
+    if not isolated:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
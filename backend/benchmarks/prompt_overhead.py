@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Per-turn prompt overhead micro-benchmark.
+
+Compares the old assistant path (re-render the full system prompt template
+and re-bind all tools on every assistant step) with the cached path
+(tools bound once, user part of the prompt cached, only time fields filled
+in per turn). No model call is made; the user lookup is stubbed so only the
+prompt-building cost is measured.
+
+Usage:
+    python benchmarks/prompt_overhead.py --turns 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py builds its clients at import time; none of them is contacted here
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+os.environ.setdefault("NEXT_PUBLIC_SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("NEXT_PUBLIC_SUPABASE_ANON_KEY", "benchmark")
+os.environ.setdefault("CHECKPOINTER_BACKEND", "memory")
+
+from datetime import datetime
+
+from langchain_core.messages import HumanMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+import main
+
+USER = {"id": 1, "user_description": "Office worker in Hanoi, buys coffee most mornings. " * 20}
+
+
+def old_turn(state):
+    """The assistant setup as it was done on every step before caching"""
+    now = datetime.now()
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", main.system_prompt_template),
+        ("placeholder", "{messages}"),
+    ]).partial(
+        user_email=state["user_email"],
+        current_time=now.strftime("%H:%M"),
+        current_date=now.strftime("%B %d, %Y"),
+        user_description=USER["user_description"],
+    )
+    runnable = prompt | main.llm.bind_tools(main.tools)
+    return runnable.first.invoke(state)
+
+
+def new_turn(state):
+    system_message = main.get_system_message(state)
+    return main.assistant_runnable.first.invoke({**state, "system_message": system_message})
+
+
+def measure(fn, state, turns):
+    fn(state)  # warm up
+    start = time.perf_counter()
+    for _ in range(turns):
+        fn(state)
+    return (time.perf_counter() - start) / turns * 1000
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description="Prompt overhead micro-benchmark")
+    parser.add_argument("--turns", type=int, default=1000)
+    args = parser.parse_args()
+
+    main.get_user_data = lambda supabase, email: USER
+    main.get_supabase_client = lambda: None
+    state = {
+        "user_email": "benchmark@example.com",
+        "messages": [HumanMessage(content="How much did I spend on coffee this week?")],
+    }
+
+    before = measure(old_turn, state, args.turns)
+    after = measure(new_turn, state, args.turns)
+
+    print("\n=== Per-turn prompt overhead ===")
+    print(f"Before (render + bind_tools each step): {before:.3f} ms")
+    print(f"After  (cached prefix, tools bound once): {after:.3f} ms")
+    print(f"Speed-up: {before / after:.1f}x")
+    print(f"Prompt cache: {main.prompt_cache.stats()}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
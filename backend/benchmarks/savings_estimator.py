@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Speed and correctness checks for the predict_savings estimator.
+
+Runs a set of known cases through savings.estimate_savings (steady saver,
+money parked for a single month, irregular spacing, month-end and year-end date
+arithmetic) and then times the estimator on ten years of monthly data,
+which must stay well under a millisecond to run inline in a chat turn.
+
+Usage:
+    python benchmarks/savings_estimator.py --years 10 --runs 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from savings import add_months, estimate_savings, monthly_series
+
+TODAY = date(2025, 6, 15)
+
+
+def months_back(count, amounts):
+    start = add_months(date(TODAY.year, TODAY.month, 1), -count)
+    return [{"month": add_months(start, i).isoformat(), "net_cents": amount}
+            for i, amount in enumerate(amounts)]
+
+
+def check(name, condition):
+    print(f"{'PASS' if condition else 'FAIL'}  {name}")
+    return condition
+
+
+def correctness():
+    ok = True
+
+    ok &= check("add_months: Jan 31 + 1 is Feb 29 in a leap year", add_months(date(2024, 1, 31), 1) == date(2024, 2, 29))
+    ok &= check("add_months: Dec + 1 rolls the year", add_months(date(2025, 12, 10), 1) == date(2026, 1, 10))
+    ok &= check("add_months: 30 months from November", add_months(date(2025, 11, 30), 30) == date(2028, 5, 30))
+    ok &= check("add_months: negative offsets", add_months(date(2025, 3, 31), -1) == date(2025, 2, 28))
+
+    first, net = monthly_series(
+        [{"month": "2025-02-01", "net_cents": 100}, {"month": "2025-05-01", "net_cents": 50}], TODAY)
+    ok &= check("resampling fills empty months with zero",
+                first == date(2025, 2, 1) and net.tolist() == [100, 0, 0, 50, 0])
+
+    steady = months_back(12, [1_000_000] * 12)
+    estimate = estimate_savings(12_000_000, steady, 18_000_000, today=TODAY)
+    ok &= check("steady saver: rate is the monthly amount", abs(estimate["monthly_rate"] - 1_000_000) < 1e-6)
+    ok &= check("steady saver: 6 months to go, past December",
+                estimate["months_to_target"] == 6 and estimate["target_date"] == date(2025, 12, 15))
+    ok &= check("steady saver: bounds collapse to the rate",
+                estimate["rate_low"] == estimate["rate_high"] == estimate["monthly_rate"])
+
+    parked = [1_000_000] * 12
+    parked[5], parked[6] = 30_000_000, -28_000_000
+    estimate = estimate_savings(sum(parked), months_back(12, parked), sum(parked) + 12_000_000, today=TODAY)
+    ok &= check("money parked for one month does not move the robust rate",
+                abs(estimate["monthly_rate"] - 1_000_000) / 1_000_000 < 0.05)
+    ok &= check("bounds bracket the rate", estimate["rate_low"] <= estimate["monthly_rate"] <= estimate["rate_high"])
+
+    sparse = months_back(12, [3_000_000, 0, 0, 3_000_000, 0, 0, 3_000_000, 0, 0, 3_000_000, 0, 0])
+    estimate = estimate_savings(12_000_000, sparse, 24_000_000, today=TODAY)
+    ok &= check("quarterly saver: rate is per month, not per transaction",
+                abs(estimate["monthly_rate"] - 1_000_000) / 1_000_000 < 0.25)
+
+    shrinking = months_back(6, [-500_000] * 6)
+    estimate = estimate_savings(1_000_000, shrinking, 5_000_000, today=TODAY)
+    ok &= check("shrinking balance has no target date", estimate["target_date"] is None)
+
+    ok &= check("only the current month is not enough",
+                estimate_savings(1_000_000, months_back(0, [1_000_000]), 5_000_000, today=TODAY) is None)
+
+    estimate = estimate_savings(20_000_000, steady, 18_000_000, today=TODAY)
+    ok &= check("target already reached", estimate["months_to_target"] == 0)
+    return ok
+
+
+def speed(years, runs):
+    count = years * 12
+    amounts = [1_000_000 + (i * 7919) % 400_000 - (5_000_000 if i % 17 == 0 else 0) for i in range(count)]
+    monthly = months_back(count, amounts)
+    balance = sum(amounts)
+
+    estimate_savings(balance, monthly, balance * 2, today=TODAY)  # warm up
+    start = time.perf_counter()
+    for _ in range(runs):
+        estimate_savings(balance, monthly, balance * 2, today=TODAY)
+    per_call = (time.perf_counter() - start) / runs * 1000
+    print(f"\n=== Estimator on {years} years ({count} months) ===")
+    print(f"Per call: {per_call:.3f} ms over {runs} runs")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Savings estimator checks and benchmark")
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    ok = correctness()
+    per_call = speed(args.years, args.runs)
+    if not ok or per_call >= 1.0:
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
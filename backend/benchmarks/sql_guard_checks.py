@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Speed and correctness checks for the sql_executor query guard.
+
+Runs known queries through sql_guard.SqlGuard.prepare: ones that must be
+rejected (writes, other users' rows, system functions, row generators,
+tables outside the app schema) and ones that must come back scoped to the
+caller, including CTEs that reuse a table's name, whose body still reads
+the real table. Outer joins are run on a small two-user SQLite copy of
+the tables and must return the same rows as a hand-scoped query. Then
+times prepare on a typical dashboard query, which runs on every
+sql_executor call.
+
+Usage:
+    python benchmarks/sql_guard_checks.py --runs 2000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlglot
+
+from sql_guard import SqlGuard, SqlRejected
+
+USER_ID = 1
+
+REJECTED = [
+    ("write", "not_select", "DELETE FROM transactions"),
+    ("two statements", "multiple_statements", "SELECT 1; SELECT 2"),
+    ("another user's rows", "foreign_user", "SELECT * FROM transactions WHERE user_id = 2"),
+    ("system function", "forbidden_function", "SELECT pg_sleep(10)"),
+    ("row generator", "forbidden_function", "SELECT generate_series(1, 100000000)"),
+    ("row generator in FROM", "forbidden_function", "SELECT * FROM generate_series(1, 100000000) AS g"),
+    ("subscript generator", "forbidden_function", "SELECT generate_subscripts(ARRAY[1, 2], 1)"),
+    ("system table", "table_not_allowed", "SELECT * FROM pg_catalog.pg_user"),
+    ("cross join", "cartesian_join", "SELECT * FROM transactions t CROSS JOIN user_jars j"),
+    ("CTE reading a table outside the schema under its own name", "table_not_allowed",
+     "WITH secrets AS (SELECT * FROM secrets) SELECT * FROM secrets"),
+]
+
+# (name, query, fragments the guarded SQL must contain)
+SCOPED = [
+    ("missing filter is added", "SELECT SUM(amount) FROM transactions", ["user_id = 1"]),
+    ("CTE shadowing a table is filtered in its body",
+     "WITH transactions AS (SELECT * FROM transactions) SELECT DISTINCT user_id FROM transactions",
+     ["AS (SELECT * FROM transactions WHERE transactions.user_id = 1)"]),
+    ("later CTE reads the earlier one",
+     "WITH t AS (SELECT * FROM transactions), s AS (SELECT * FROM t) SELECT * FROM s",
+     ["FROM transactions WHERE transactions.user_id = 1"]),
+    ("CTE defined in a subquery only covers that subquery",
+     "SELECT * FROM (WITH user_jars AS (SELECT 1 AS user_id) SELECT * FROM user_jars) AS a "
+     "JOIN user_jars ON user_jars.user_id = a.user_id",
+     ["WHERE user_jars.user_id = 1"]),
+]
+
+FIXTURE = """
+CREATE TABLE jar_categories (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE monthly_income_entries (id INTEGER PRIMARY KEY, user_id INTEGER, month_year TEXT);
+CREATE TABLE user_jars (id INTEGER PRIMARY KEY, user_id INTEGER, jar_category_id INTEGER);
+CREATE TABLE transactions (id INTEGER PRIMARY KEY, user_id INTEGER, jar_category_id INTEGER,
+                           amount_cents INTEGER, monthly_income_entry_id INTEGER);
+INSERT INTO jar_categories VALUES (1, 'Necessities'), (2, 'Play'), (3, 'Education');
+INSERT INTO monthly_income_entries VALUES (1, 1, '2025-05'), (2, 2, '2025-05');
+INSERT INTO user_jars VALUES (1, 1, 1), (2, 1, 2), (3, 2, 1), (4, 2, 3);
+INSERT INTO transactions VALUES (1, 1, 1, 500, 1), (2, 1, 1, 200, NULL), (3, 1, 2, 300, NULL),
+                                (4, 2, 1, 900, 2), (5, 2, 3, 100, NULL), (6, 2, 3, 700, NULL);
+"""
+
+# (name, query, the same query scoped by hand): both must return the same rows
+OUTER_JOINS = [
+    ("LEFT JOIN keeps rows without a match",
+     "SELECT t.id, m.month_year FROM transactions t "
+     "LEFT JOIN monthly_income_entries m ON m.id = t.monthly_income_entry_id WHERE t.user_id = 1",
+     "SELECT t.id, m.month_year FROM transactions t "
+     "LEFT JOIN monthly_income_entries m ON m.id = t.monthly_income_entry_id AND m.user_id = 1 WHERE t.user_id = 1"),
+    ("aggregate over LEFT JOIN keeps empty groups",
+     "SELECT j.name, COUNT(t.id), SUM(t.amount_cents) FROM jar_categories j "
+     "LEFT JOIN transactions t ON t.jar_category_id = j.id GROUP BY j.name",
+     "SELECT j.name, COUNT(t.id), SUM(t.amount_cents) FROM jar_categories j "
+     "LEFT JOIN transactions t ON t.jar_category_id = j.id AND t.user_id = 1 GROUP BY j.name"),
+    ("filter already in the ON clause",
+     "SELECT j.name, COUNT(t.id) FROM jar_categories j "
+     "LEFT JOIN transactions t ON t.jar_category_id = j.id AND t.user_id = 1 GROUP BY j.name",
+     "SELECT j.name, COUNT(t.id) FROM jar_categories j "
+     "LEFT JOIN transactions t ON t.jar_category_id = j.id AND t.user_id = 1 GROUP BY j.name"),
+    ("RIGHT JOIN keeps the preserved side",
+     "SELECT j.name, t.id FROM transactions t RIGHT JOIN jar_categories j ON t.jar_category_id = j.id",
+     "SELECT j.name, t.id FROM transactions t RIGHT JOIN jar_categories j "
+     "ON t.jar_category_id = j.id AND t.user_id = 1"),
+    ("FULL JOIN shows neither side of another user",
+     "SELECT u.id, t.id FROM user_jars u FULL JOIN transactions t ON t.jar_category_id = u.jar_category_id",
+     "SELECT u.id, t.id FROM (SELECT * FROM user_jars WHERE user_id = 1) u "
+     "FULL JOIN (SELECT * FROM transactions WHERE user_id = 1) t ON t.jar_category_id = u.jar_category_id"),
+    ("LEFT JOIN with USING",
+     "SELECT j.id, u.user_id FROM jar_categories j LEFT JOIN user_jars u USING (id)",
+     "SELECT j.id, u.user_id FROM jar_categories j "
+     "LEFT JOIN (SELECT * FROM user_jars WHERE user_id = 1) u USING (id)"),
+]
+
+
+def run(db, query):
+    return sorted(db.execute(sqlglot.transpile(query, read="postgres", write="sqlite")[0]).fetchall(), key=repr)
+
+
+def check(name, condition):
+    print(f"{'PASS' if condition else 'FAIL'}  {name}")
+    return condition
+
+
+def correctness():
+    ok = True
+    guard = SqlGuard()
+    for name, reason, query in REJECTED:
+        try:
+            guard.prepare(query, USER_ID)
+            got = "accepted"
+        except SqlRejected as e:
+            got = e.reason
+        ok &= check(f"rejects {name} ({got})", got == reason)
+
+    for name, query, fragments in SCOPED:
+        try:
+            guarded = guard.prepare(query, USER_ID)
+        except SqlRejected as e:
+            guarded = f"rejected: {e}"
+        passed = all(fragment in guarded for fragment in fragments)
+        ok &= check(name, passed)
+        if not passed:
+            print(f"      {guarded}")
+
+    db = sqlite3.connect(":memory:")
+    db.executescript(FIXTURE)
+    for name, query, reference in OUTER_JOINS:
+        guarded = guard.prepare(query, USER_ID)
+        rows, expected = run(db, guarded), run(db, reference)
+        passed = rows == expected
+        ok &= check(f"{name} ({len(rows)} rows, expected {len(expected)})", passed)
+        if not passed:
+            print(f"      {guarded}")
+    return ok
+
+
+def speed(runs):
+    guard = SqlGuard()
+    query = (
+        "SELECT j.name, SUM(t.amount) AS spent FROM transactions t "
+        "JOIN user_jars j ON j.id = t.jar_id "
+        "WHERE t.transaction_date >= '2025-01-01' GROUP BY j.name ORDER BY spent DESC"
+    )
+    guard.prepare(query, USER_ID)  # warm up
+    start = time.perf_counter()
+    for _ in range(runs):
+        guard.prepare(query, USER_ID)
+    per_call = (time.perf_counter() - start) / runs * 1000
+    print("\n=== SqlGuard.prepare on a two-table aggregate ===")
+    print(f"Per call: {per_call:.3f} ms over {runs} runs")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQL guard checks and benchmark")
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    ok = correctness()
+    speed(args.runs)
+    if not ok:
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
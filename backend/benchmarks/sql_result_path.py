@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the sql_executor result path.
+
+Builds a fake `run_sql` result of transaction rows and compares the old
+path (format every cell of every row into a new dict and hand the whole
+list to the model) with the paginated, columnar, token-budgeted encoding.
+The paginated path is measured on what Postgres sends back for one page;
+the in-memory encoding of the full result is reported as well so the
+token budget's effect can be seen on its own. No database is needed.
+
+Usage:
+    python benchmarks/sql_result_path.py --rows 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sql_results import SQL_PAGE_SIZE, encode_result
+
+
+def fake_rows(count):
+    start = datetime(2022, 1, 1)
+    return [
+        {
+            "id": i,
+            "user_id": 1,
+            "jar_id": i % 6 + 1,
+            "amount": 10000 + (i * 7919) % 500000,
+            "transaction_type": "expense" if i % 10 else "income",
+            "description": f"Coffee at Highlands branch {i % 37}",
+            "transaction_date": (start + timedelta(hours=i)).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+def old_path(rows):
+    """sql_executor's formatting before pagination and columnar encoding"""
+    formatted_data = []
+    for row in rows:
+        formatted_row = {}
+        for key, val in row.items():
+            if isinstance(val, (int, float)):
+                formatted_row[key] = f"{val:,}"
+            elif isinstance(val, datetime):
+                formatted_row[key] = val.isoformat()
+            else:
+                formatted_row[key] = str(val)
+        formatted_data.append(formatted_row)
+    return {
+        "status": "success",
+        "message": "Query executed successfully",
+        "data": formatted_data,
+        "total_rows": len(formatted_data),
+    }
+
+
+def measure(name, fn, rows):
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = fn(rows)
+    payload = json.dumps(response, ensure_ascii=False)
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"\n=== {name} ===")
+    print(f"Rows in:             {len(rows)}")
+    print(f"Elapsed:             {elapsed:.1f} ms")
+    print(f"Peak allocations:    {peak / 1024 / 1024:.1f} MB")
+    print(f"Tool message size:   {len(payload) / 1024:.1f} KB (~{len(payload) // 4} tokens)")
+    return len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sql_executor result path benchmark")
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    rows = fake_rows(args.rows)
+    before = measure("Old path (every row, formatted dicts)", old_path, rows)
+    measure(
+        "Columnar + token budget (full result in memory)",
+        lambda all_rows: encode_result(all_rows, page_size=len(all_rows)),
+        rows,
+    )
+    after = measure(
+        f"Paginated (Postgres returns {SQL_PAGE_SIZE + 1} rows)",
+        encode_result,
+        rows[:SQL_PAGE_SIZE + 1],
+    )
+    print(f"\nTool message shrinks {before / after:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Cross-talk stress test for conversation thread identity.
+
+Simulates many users, each sending several concurrent messages, through a
+minimal LangGraph graph backed by the same checkpointer and per-thread locks
+as the chat endpoint. The requests are spread over several worker processes
+sharing one SQLite file, as under `uvicorn --workers N`, so each user's
+turns also race across processes. Afterwards every thread must contain only
+its own user's messages, with no lost turns; two of the users have emails
+that differ only in case. --no-leases runs the same load with only the
+in-process locks, which is expected to lose turns.
+
+Usage:
+    python benchmarks/thread_isolation_stress.py --users 1000 --requests-per-user 2 --processes 4
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, START, StateGraph
+from langgraph.graph.message import add_messages
+from typing_extensions import Annotated, TypedDict
+
+from checkpointer import BoundedSqliteSaver
+from threads import ThreadLocks, thread_id_for
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+async def echo(state: State):
+    # Yield to other requests mid-turn to widen any race window
+    await asyncio.sleep(random.random() * 0.005)
+    return {"messages": [AIMessage(content=f"ack:{state['messages'][-1].content}")]}
+
+
+async def send(graph, locks, semaphore, email, n):
+    thread_id = thread_id_for(email)
+    async with semaphore:
+        async with locks.hold(thread_id):
+            await graph.ainvoke(
+                {"messages": [HumanMessage(content=f"{email}|{n}")]},
+                {"configurable": {"thread_id": thread_id}},
+            )
+
+
+def build_graph(saver):
+    builder = StateGraph(State)
+    builder.add_node("assistant", echo)
+    builder.add_edge(START, "assistant")
+    builder.add_edge("assistant", END)
+    return builder.compile(checkpointer=saver)
+
+
+async def worker(path, emails, requests_per_user, concurrency, use_leases, index):
+    """One worker process: its own checkpointer connection and locks"""
+    saver = BoundedSqliteSaver(path, max_threads=len(emails) * 2)
+    graph = build_graph(saver)
+    locks = ThreadLocks(leases=saver if use_leases else None)
+    semaphore = asyncio.Semaphore(concurrency)
+    requests = [(email, f"p{index}.{n}") for email in emails for n in range(requests_per_user)]
+    random.Random(index).shuffle(requests)
+    await asyncio.gather(*[send(graph, locks, semaphore, email, n) for email, n in requests])
+    saver.close()
+    return locks.waits, locks.lease_waits
+
+
+def run_worker(*args):
+    return asyncio.run(worker(*args))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Thread isolation stress test")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--requests-per-user", type=int, default=2)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=200, help="in-flight requests per process")
+    parser.add_argument("--no-leases", action="store_true", help="in-process locks only")
+    args = parser.parse_args()
+
+    emails = [f"user{i}@example.com" for i in range(args.users)]
+    # Distinct accounts whose emails differ only in case
+    emails[-2:] = ["Case.Variant@example.com", "case.variant@example.com"]
+    thread_ids = {thread_id_for(email) for email in emails}
+    print(f"Distinct thread IDs: {len(thread_ids)} for {len(emails)} users")
+    turns = args.requests_per_user * args.processes
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stress.sqlite")
+        BoundedSqliteSaver(path).close()  # create the schema before the workers race for it
+
+        start = time.perf_counter()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.processes, mp_context=context) as pool:
+            futures = [
+                pool.submit(run_worker, path, emails, args.requests_per_user, args.concurrency,
+                            not args.no_leases, index)
+                for index in range(args.processes)
+            ]
+            waits = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+
+        saver = BoundedSqliteSaver(path, max_threads=args.users * 2)
+        graph = build_graph(saver)
+        cross_talk = 0
+        lost_turns = 0
+        for email in emails:
+            state = await graph.aget_state({"configurable": {"thread_id": thread_id_for(email)}})
+            messages = state.values.get("messages", [])
+            for message in messages:
+                owner = message.content.split("ack:", 1)[-1].split("|", 1)[0]
+                if owner != email:
+                    cross_talk += 1
+            if len(messages) != 2 * turns:
+                lost_turns += 1
+        saver.close()
+
+    print("\n=== Thread isolation stress test ===")
+    print(f"Processes:            {args.processes} ({'in-process locks only' if args.no_leases else 'with leases'})")
+    print(f"Requests:             {args.users * turns} in {elapsed:.1f}s")
+    print(f"Contended lock waits: {sum(w for w, _ in waits)} in-process, {sum(w for _, w in waits)} across processes")
+    print(f"Cross-talk messages:  {cross_talk}")
+    print(f"Threads with lost turns: {lost_turns}")
+    if len(thread_ids) != len(emails) or cross_talk or lost_turns:
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
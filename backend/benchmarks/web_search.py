@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the search_web adapter against a local stand-in provider.
+
+Replays a burst of chat searches in which most questions repeat with
+different casing and spacing ("current gold price in Vietnam"). The
+uncached baseline calls the provider once per search on a worker thread,
+like the old synchronous tool; the adapter answers repeats from its cache,
+shares in-flight searches and never runs more than --concurrency provider
+calls at once. Also checks that a failed search is not cached.
+
+Usage:
+    python benchmarks/web_search.py --searches 200 --distinct 20 --latency-ms 400
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import WebSearch
+
+
+class StandInSearch:
+    """Answers after a fixed delay and records how many calls overlap"""
+
+    def __init__(self, latency_s, fail_queries=()):
+        self.latency_s = latency_s
+        self.fail_queries = set(fail_queries)
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    def invoke(self, query):
+        self.calls += 1
+        time.sleep(self.latency_s)
+        return {"query": query, "results": [{"title": f"Result for {query}"}]}
+
+    async def ainvoke(self, query):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.latency_s)
+            if query in self.fail_queries:
+                raise RuntimeError("provider error")
+            return {"query": query, "results": [{"title": f"Result for {query}"}]}
+        finally:
+            self.active -= 1
+
+
+def workload(searches, distinct, seed=7):
+    """Repeated queries with varying case and spacing, arriving in a burst"""
+    rnd = random.Random(seed)
+    topics = [f"current gold price in vietnam {i}" for i in range(distinct)]
+    queries = []
+    for _ in range(searches):
+        words = rnd.choice(topics).split()
+        words = [word.upper() if rnd.random() < 0.2 else word for word in words]
+        queries.append(("  " if rnd.random() < 0.3 else " ").join(words))
+    return queries
+
+
+async def run_baseline(queries, latency_s):
+    provider = StandInSearch(latency_s)
+    start = time.perf_counter()
+    await asyncio.gather(*[asyncio.to_thread(provider.invoke, query) for query in queries])
+    return time.perf_counter() - start, provider.calls
+
+
+async def run_adapter(queries, latency_s, concurrency):
+    provider = StandInSearch(latency_s)
+    search = WebSearch(provider, concurrency=concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*[search.search(query) for query in queries])
+    wall = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await search.search(queries[0])
+    repeat_ms = (time.perf_counter() - start) * 1000
+    return wall, provider, search, repeat_ms
+
+
+async def check_errors(latency_s):
+    provider = StandInSearch(latency_s, fail_queries={"broken"})
+    search = WebSearch(provider)
+    results = await asyncio.gather(*[search.search("broken") for _ in range(5)], return_exceptions=True)
+    shared = provider.calls == 1 and all(isinstance(r, RuntimeError) for r in results)
+    await asyncio.gather(search.search("broken"), return_exceptions=True)
+    return shared and provider.calls == 2
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="search_web adapter benchmark")
+    parser.add_argument("--searches", type=int, default=200)
+    parser.add_argument("--distinct", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=400)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    latency_s = args.latency_ms / 1000
+    queries = workload(args.searches, args.distinct)
+
+    baseline_wall, baseline_calls = await run_baseline(queries, latency_s)
+    wall, provider, search, repeat_ms = await run_adapter(queries, latency_s, args.concurrency)
+    errors_ok = await check_errors(latency_s / 10)
+    stats = search.stats()
+
+    print(f"\n=== {args.searches} searches, {args.distinct} distinct, {args.latency_ms:g} ms provider latency ===")
+    print(f"Uncached:  {baseline_calls} provider calls, {baseline_wall:.2f}s wall")
+    print(f"Adapter:   {provider.calls} provider calls, {wall:.2f}s wall, "
+          f"peak {provider.peak} concurrent (limit {args.concurrency})")
+    print(f"           {stats['coalesced']} coalesced, cache hit rate {stats['cache']['hit_rate']}")
+    print(f"Repeat of a cached query: {repeat_ms:.3f} ms")
+    print(f"Failed search shared by waiters and not cached: {'PASS' if errors_ok else 'FAIL'}")
+
+    ok = provider.calls == args.distinct and provider.peak <= args.concurrency and errors_ok
+    print("OK" if ok else "FAILED")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
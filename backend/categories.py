@@ -0,0 +1,103 @@
+"""Process-wide registry of the jar categories"""
+import threading
+import time
+from typing import Callable, Optional
+
+# A lookup miss reloads the table at most this often
+MISS_REFRESH_INTERVAL = 30.0
+
+
+class CategoryRegistry:
+    """`jar_categories` loaded once, with id->name and name->id lookups.
+
+    Categories only change through migrations, so the table is read at
+    startup and again only when a lookup misses (or on `refresh()`).
+    """
+
+    def __init__(self, client_getter: Callable):
+        self.client_getter = client_getter
+        self._by_id = {}
+        self._by_name = {}
+        self._lock = threading.Lock()
+        self._last_refresh = None
+        self.refreshes = 0
+        self.last_error = None
+
+    def refresh(self) -> dict:
+        """Reload every category from the database"""
+        result = self.client_getter().table('jar_categories').select('id, name, description').order('id').execute()
+        categories = {row['id']: row for row in result.data or []}
+        with self._lock:
+            self._by_id = categories
+            self._by_name = {row['name'].lower(): row for row in categories.values()}
+            self._last_refresh = time.monotonic()
+            self.refreshes += 1
+            self.last_error = None
+        print(f"Loaded {len(categories)} jar categories")
+        return categories
+
+    def load(self):
+        """Startup load; a failure is recorded and retried on first lookup"""
+        try:
+            self.refresh()
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Jar category load failed: {e}")
+
+    def ensure_loaded(self) -> bool:
+        """Retry a failed startup load (rate limited); True if categories are available"""
+        if not self._by_id:
+            try:
+                self._refresh_on_miss()
+            except Exception as e:
+                self.last_error = str(e)
+        return bool(self._by_id)
+
+    def _refresh_on_miss(self):
+        # The attempt is stamped before refreshing so a failing database is
+        # retried at most once per interval rather than on every lookup
+        with self._lock:
+            now = time.monotonic()
+            if self._last_refresh is not None and now - self._last_refresh <= MISS_REFRESH_INTERVAL:
+                return
+            self._last_refresh = now
+        self.refresh()
+
+    def get(self, category_id: int) -> Optional[dict]:
+        """Category row for `category_id`, or None if there is no such category"""
+        category = self._by_id.get(category_id)
+        if category is None:
+            self._refresh_on_miss()
+            category = self._by_id.get(category_id)
+        return category
+
+    def id_for(self, name: str) -> int:
+        """ID of the category called `name` (case-insensitive)"""
+        category = self._by_name.get(name.lower())
+        if category is None:
+            self._refresh_on_miss()
+            category = self._by_name.get(name.lower())
+        if category is None:
+            raise Exception(f"Unknown jar category: {name}")
+        return category['id']
+
+    def name_for(self, category_id: int) -> str:
+        """Name of the category with `category_id`"""
+        category = self.get(category_id)
+        if category is None:
+            raise Exception(f"Unknown jar category ID {category_id}. Valid categories: {self.describe()}")
+        return category['name']
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def describe(self) -> str:
+        """Categories as `{1: Necessity, 2: Play, ...}`; never hits the database"""
+        return "{" + ", ".join(f"{category_id}: {row['name']}" for category_id, row in sorted(self._by_id.items())) + "}"
+
+    def stats(self) -> dict:
+        return {
+            "categories": len(self._by_id),
+            "refreshes": self.refreshes,
+            "last_error": self.last_error,
+        }
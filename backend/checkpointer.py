@@ -0,0 +1,508 @@
+"""Bounded, persistent conversation checkpointer for the chat graph"""
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Iterator, Optional, Sequence
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+try:
+    from langgraph.checkpoint.base import get_checkpoint_metadata
+except ImportError:  # older langgraph-checkpoint
+    def get_checkpoint_metadata(config, metadata):
+        return metadata
+
+CHECKPOINTER_BACKEND = os.getenv("CHECKPOINTER_BACKEND", "sqlite")
+CHECKPOINT_DB_PATH = os.getenv(
+    "CHECKPOINT_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints.sqlite"),
+)
+CHECKPOINT_MAX_MESSAGES = int(os.getenv("CHECKPOINT_MAX_MESSAGES", "60"))
+CHECKPOINT_MAX_BYTES = int(os.getenv("CHECKPOINT_MAX_BYTES", str(2 * 1024 * 1024)))
+CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "10000"))
+CHECKPOINT_IDLE_TTL = float(os.getenv("CHECKPOINT_IDLE_TTL", str(7 * 24 * 3600)))
+CHECKPOINT_KEEP_LATEST = int(os.getenv("CHECKPOINT_KEEP_LATEST", "3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_threads_last_access ON threads(last_access);
+CREATE TABLE IF NOT EXISTS thread_leases (
+    thread_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+def _drop_oldest_turn(messages: list) -> list:
+    """Remove everything before the second human message (one full turn).
+
+    The last turn is never dropped, so the history always starts with its
+    human message.
+    """
+    for i in range(1, len(messages)):
+        if isinstance(messages[i], HumanMessage):
+            return messages[i:]
+    return messages
+
+
+def trim_messages_window(messages: list, max_messages: int) -> list:
+    """Keep the newest messages, starting on a human turn so tool results
+    never lose the AI message that requested them. A last turn longer than
+    `max_messages` is kept whole."""
+    if len(messages) <= max_messages:
+        return messages
+    start = len(messages) - max_messages
+    for i in range(start, len(messages)):
+        if isinstance(messages[i], HumanMessage):
+            return messages[i:]
+    for i in range(start - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return messages[i:]
+    return messages
+
+
+class BoundedSqliteSaver(BaseCheckpointSaver):
+    """SQLite-backed checkpointer with per-thread and global bounds.
+
+    - Each thread's `messages` channel is capped by message count and by
+      serialized size; whole turns are dropped from the front.
+    - Only the newest `keep_latest` checkpoints of a thread are kept, older
+      checkpoints, their writes and unreferenced blobs are compacted away.
+    - Threads idle longer than `idle_ttl`, or beyond `max_threads` in LRU
+      order, are evicted.
+    - `acquire_lease` / `release_lease` give one request at a time, in any
+      worker process sharing the file, ownership of a thread.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_DB_PATH, *,
+                 max_messages: int = CHECKPOINT_MAX_MESSAGES,
+                 max_bytes: int = CHECKPOINT_MAX_BYTES,
+                 max_threads: int = CHECKPOINT_MAX_THREADS,
+                 idle_ttl: float = CHECKPOINT_IDLE_TTL,
+                 keep_latest: int = CHECKPOINT_KEEP_LATEST,
+                 serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_threads = max_threads
+        self.idle_ttl = idle_ttl
+        self.keep_latest = max(1, keep_latest)
+        self.evicted_threads = 0
+        self.trimmed_messages = 0
+        self._lock = threading.RLock()
+        # timeout: wait for other worker processes holding the write lock
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    # -- helpers -----------------------------------------------------------
+
+    def _bound_messages(self, messages: list) -> tuple:
+        """Apply the message-count and byte caps, return (messages, serialized)"""
+        original = len(messages)
+        messages = trim_messages_window(messages, self.max_messages)
+        serialized = self.serde.dumps_typed(messages)
+        while len(serialized[1]) > self.max_bytes:
+            trimmed = _drop_oldest_turn(messages)
+            if len(trimmed) == len(messages):
+                break
+            messages = trimmed
+            serialized = self.serde.dumps_typed(messages)
+        self.trimmed_messages += original - len(messages)
+        return messages, serialized
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict:
+        values = {}
+        for channel, version in versions.items():
+            row = self.conn.execute(
+                "SELECT type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if row and row[0] != "empty":
+                values[channel] = self.serde.loads_typed((row[0], row[1]))
+        return values
+
+    def _load_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list:
+        rows = self.conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return [(task_id, channel, self.serde.loads_typed((type_, value))) for task_id, channel, type_, value in rows]
+
+    def _make_tuple(self, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint_b, metadata_type, metadata_b = row
+        checkpoint = self.serde.loads_typed((type_, checkpoint_b))
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint["channel_versions"]),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_b)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=self._load_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def _touch(self, thread_id: str):
+        self.conn.execute(
+            "INSERT INTO threads (thread_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET last_access = excluded.last_access",
+            (thread_id, time.time()),
+        )
+
+    def _compact(self, thread_id: str, checkpoint_ns: str):
+        """Drop all but the newest checkpoints of a thread and orphaned data"""
+        stale = [row[0] for row in self.conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.keep_latest),
+        )]
+        if not stale:
+            return
+        marks = ",".join("?" * len(stale))
+        self.conn.execute(
+            f"DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id IN ({marks})",
+            (thread_id, checkpoint_ns, *stale),
+        )
+        self.conn.execute(
+            f"DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id IN ({marks})",
+            (thread_id, checkpoint_ns, *stale),
+        )
+        # The oldest kept checkpoint no longer has a parent on disk
+        self.conn.execute(
+            f"UPDATE checkpoints SET parent_checkpoint_id = NULL "
+            f"WHERE thread_id = ? AND checkpoint_ns = ? AND parent_checkpoint_id IN ({marks})",
+            (thread_id, checkpoint_ns, *stale),
+        )
+
+        referenced = set()
+        for type_, checkpoint_b in self.conn.execute(
+            "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ):
+            for channel, version in self.serde.loads_typed((type_, checkpoint_b))["channel_versions"].items():
+                referenced.add((channel, str(version)))
+        for channel, version in self.conn.execute(
+            "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ).fetchall():
+            if (channel, version) not in referenced:
+                self.conn.execute(
+                    "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                    (thread_id, checkpoint_ns, channel, version),
+                )
+
+    def _evict(self):
+        """Evict idle threads and the least recently used beyond max_threads"""
+        victims = [row[0] for row in self.conn.execute(
+            "SELECT thread_id FROM threads WHERE last_access < ?",
+            (time.time() - self.idle_ttl,),
+        )]
+        overflow = self.conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0] - self.max_threads
+        if overflow > 0:
+            victims += [row[0] for row in self.conn.execute(
+                "SELECT thread_id FROM threads ORDER BY last_access ASC LIMIT ?", (overflow,)
+            )]
+        for thread_id in set(victims):
+            self._delete_thread(thread_id)
+            self.evicted_threads += 1
+
+    def _delete_thread(self, thread_id: str):
+        for table in ("checkpoints", "blobs", "writes", "threads"):
+            self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    # -- BaseCheckpointSaver -----------------------------------------------
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        query = ("SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                 "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?")
+        with self._lock:
+            if checkpoint_id:
+                row = self.conn.execute(query + " AND checkpoint_id = ?",
+                                        (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+            else:
+                row = self.conn.execute(query + " ORDER BY checkpoint_id DESC LIMIT 1",
+                                        (thread_id, checkpoint_ns)).fetchone()
+            if row is None:
+                return None
+            self._touch(thread_id)
+            return self._make_tuple(thread_id, checkpoint_ns, row)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[dict] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                 "metadata_type, metadata FROM checkpoints WHERE 1 = 1")
+        params = []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            query += " AND checkpoint_id < ?"
+            params.append(get_checkpoint_id(before))
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                checkpoint_tuple = self._make_tuple(thread_id, checkpoint_ns, row)
+                if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(checkpoint_tuple)
+        yield from results
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+
+        blobs = []
+        for channel, version in new_versions.items():
+            if channel not in values:
+                blobs.append((channel, str(version), "empty", b""))
+                continue
+            value = values[channel]
+            if channel == "messages" and isinstance(value, list):
+                _, serialized = self._bound_messages(value)
+            else:
+                serialized = self.serde.dumps_typed(value)
+            blobs.append((channel, str(version), serialized[0], serialized[1]))
+
+        type_, checkpoint_b = self.serde.dumps_typed(c)
+        metadata_type, metadata_b = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO blobs (thread_id, checkpoint_ns, channel, version, type, value) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(thread_id, checkpoint_ns, *blob) for blob in blobs],
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, "
+                    "parent_checkpoint_id, type, checkpoint, metadata_type, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], parent_checkpoint_id,
+                     type_, checkpoint_b, metadata_type, metadata_b),
+                )
+                self._touch(thread_id)
+                self._compact(thread_id, checkpoint_ns)
+                self._evict()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, value_b = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id,
+                         WRITES_IDX_MAP.get(channel, idx), channel, type_, value_b, task_path))
+        columns = "(thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path)"
+        with self._lock:
+            # Special channels (errors, interrupts) overwrite, regular writes are stored once
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO writes {columns} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row for row in rows if row[4] < 0],
+            )
+            self.conn.executemany(
+                f"INSERT OR IGNORE INTO writes {columns} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row for row in rows if row[4] >= 0],
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._delete_thread(thread_id)
+
+    def acquire_lease(self, thread_id: str, owner: str, ttl: float) -> bool:
+        """Take or extend `owner`'s lease on a thread; False while another
+        owner holds an unexpired one. A single upsert, so it is atomic
+        across processes."""
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO thread_leases (thread_id, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE thread_leases.owner = excluded.owner OR thread_leases.expires < ?",
+                (thread_id, owner, now + ttl, now),
+            )
+            return cursor.rowcount == 1
+
+    def release_lease(self, thread_id: str, owner: str) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM thread_leases WHERE thread_id = ? AND owner = ?", (thread_id, owner))
+
+    def get_next_version(self, current: Optional[str], channel: Any = None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[dict] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None):
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple], task_id: str,
+                          task_path: str = "") -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            threads = self.conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+            checkpoints = self.conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "max_threads": self.max_threads,
+            "max_messages": self.max_messages,
+            "max_bytes": self.max_bytes,
+            "evicted_threads": self.evicted_threads,
+            "trimmed_messages": self.trimmed_messages,
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def create_checkpointer(backend: str = CHECKPOINTER_BACKEND):
+    """Build the checkpointer selected by CHECKPOINTER_BACKEND"""
+    if backend == "memory":
+        print("Using in-memory checkpointer (unbounded, lost on restart)")
+        return InMemorySaver()
+    if backend == "sqlite":
+        print(f"Using SQLite checkpointer at {CHECKPOINT_DB_PATH}")
+        return BoundedSqliteSaver(CHECKPOINT_DB_PATH)
+    raise ValueError(f"Unknown CHECKPOINTER_BACKEND: {backend}")
+
+
+def thread_leases(checkpointer):
+    """The store that serializes a thread across worker processes, if any.
+
+    The in-memory saver lives in one process, so it has none and must run
+    with a single worker.
+    """
+    if isinstance(checkpointer, BoundedSqliteSaver):
+        return checkpointer
+    return None
+
+
+def checkpointer_stats(checkpointer) -> dict:
+    if isinstance(checkpointer, BoundedSqliteSaver):
+        return checkpointer.stats()
+    return {"backend": type(checkpointer).__name__}
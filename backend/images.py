@@ -0,0 +1,160 @@
+"""Decoding, downsizing and de-duplication of chat image uploads"""
+import base64
+import binascii
+import hashlib
+import math
+import os
+import threading
+from io import BytesIO
+from typing import NamedTuple
+
+from PIL import Image, ImageOps
+
+from cache import TTLCache
+
+# Longest side sent to the model; receipts stay legible at this size
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1536"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+# Largest decoded upload accepted, and the pixel count beyond which it is refused
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(50_000_000)))
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "128"))
+
+# Gemini bills images up to 384px as one tile, larger ones as 768px tiles
+GEMINI_TILE = 768
+GEMINI_TOKENS_PER_TILE = 258
+
+
+class ImageRejected(Exception):
+    """The upload is not an image the pipeline can use"""
+
+
+class PreparedImage(NamedTuple):
+    sha256: str
+    data_url: str
+    width: int
+    height: int
+    original_bytes: int
+    bytes: int
+
+    @property
+    def tokens(self) -> int:
+        return gemini_image_tokens(self.width, self.height)
+
+
+def gemini_image_tokens(width: int, height: int) -> int:
+    """Approximate prompt tokens Gemini charges for an image of this size"""
+    if width <= 384 and height <= 384:
+        return GEMINI_TOKENS_PER_TILE
+    return math.ceil(width / GEMINI_TILE) * math.ceil(height / GEMINI_TILE) * GEMINI_TOKENS_PER_TILE
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """RGB copy of `image`; transparency is composited onto white"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+class ImagePipeline:
+    """Turns an uploaded base64 image into a small JPEG data URL.
+
+    The image is rotated according to its EXIF orientation, scaled so its
+    longest side is at most `max_side` and re-encoded as JPEG. JPEGs are
+    decoded at reduced scale straight away, so a 12 MP phone photo never
+    exists at full size in memory. Results are cached by the SHA-256 of
+    the upload, so the same photo sent twice is processed once.
+    """
+
+    def __init__(self, max_side: int = IMAGE_MAX_SIDE, quality: int = IMAGE_JPEG_QUALITY,
+                 max_upload_bytes: int = IMAGE_MAX_UPLOAD_BYTES, max_pixels: int = IMAGE_MAX_PIXELS,
+                 cache: TTLCache = None):
+        self.max_side = max_side
+        self.quality = quality
+        self.max_upload_bytes = max_upload_bytes
+        self.max_pixels = max_pixels
+        self.cache = cache if cache is not None else TTLCache(maxsize=IMAGE_CACHE_SIZE, ttl=3600)
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.rejected = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _reject(self, message: str):
+        with self._lock:
+            self.rejected += 1
+        raise ImageRejected(message)
+
+    def prepare(self, image_data: str) -> PreparedImage:
+        """Decode, shrink and re-encode a base64 upload (a data URL prefix is allowed)"""
+        if image_data.startswith("data:"):
+            image_data = image_data.partition(",")[2]
+        if len(image_data) * 3 // 4 > self.max_upload_bytes:
+            self._reject(f"Image is larger than {self.max_upload_bytes // (1024 * 1024)} MB")
+        try:
+            raw = base64.b64decode(image_data, validate=True)
+        except (binascii.Error, ValueError):
+            self._reject("Image data is not valid base64")
+
+        digest = hashlib.sha256(raw).hexdigest()
+        cached = self.cache.get(digest)
+        if cached is not None:
+            return cached
+
+        try:
+            with Image.open(BytesIO(raw)) as image:
+                if image.width * image.height > self.max_pixels:
+                    self._reject(f"Image has more than {self.max_pixels:,} pixels")
+                # JPEG decoders can scale by 1/2..1/8 while decoding
+                scale = min(1.0, self.max_side / max(image.size))
+                image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+                image = ImageOps.exif_transpose(image)
+                image = _flatten(image)
+        except ImageRejected:
+            raise
+        except Image.UnidentifiedImageError:
+            self._reject("Unsupported or corrupt image file")
+        except Exception as e:
+            self._reject(f"Could not read image: {e}")
+        image.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+
+        out = BytesIO()
+        image.save(out, format="JPEG", quality=self.quality, optimize=True)
+        encoded = out.getvalue()
+        prepared = PreparedImage(
+            sha256=digest,
+            data_url="data:image/jpeg;base64," + base64.b64encode(encoded).decode("ascii"),
+            width=image.width,
+            height=image.height,
+            original_bytes=len(raw),
+            bytes=len(encoded),
+        )
+        self.cache.set(digest, prepared)
+        with self._lock:
+            self.processed += 1
+            self.bytes_in += len(raw)
+            self.bytes_out += len(encoded)
+        return prepared
+
+    def stats(self) -> dict:
+        return {
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "max_side": self.max_side,
+            "quality": self.quality,
+            "cache": self.cache.stats(),
+        }
+
+
+def image_reference(prepared: PreparedImage) -> dict:
+    """Text block that stands in for an image once the model has seen it"""
+    return {
+        "type": "text",
+        "text": f"[Image {prepared.sha256[:12]} ({prepared.width}x{prepared.height}) was analyzed "
+                "earlier and is no longer attached; the reply to this message describes it]",
+    }
@@ -0,0 +1,248 @@
+"""Opt-in, disk-backed cache of assistant model responses"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, messages_from_dict, messages_to_dict
+from langchain_core.runnables import RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+LLM_CACHE_DB_PATH = os.getenv(
+    "LLM_CACHE_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite"),
+)
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    message TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used);
+"""
+
+# The system prompt carries the clock; only the date may take part in the key
+_VOLATILE_LINES = re.compile(r"^Current time: .*$", re.MULTILINE)
+
+
+def tools_fingerprint(tools: list) -> str:
+    """Hash of the tool schemas the model is bound to"""
+    schemas = [convert_to_openai_tool(tool) for tool in tools]
+    return hashlib.sha256(json.dumps(schemas, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _current_turn(messages: list) -> list:
+    last_human = max((i for i, message in enumerate(messages) if isinstance(message, HumanMessage)), default=0)
+    return messages[last_human:]
+
+
+def _has_image(message) -> bool:
+    return isinstance(message.content, list) and any(
+        isinstance(block, dict) and block.get("type") in ("image_url", "image") for block in message.content
+    )
+
+
+def bypass_reason(messages: list) -> Optional[str]:
+    """Why this prompt must go to the model, or None if it may be cached.
+
+    Turns carrying an image or a tool result (live data read from the
+    user's tables) are never cached.
+    """
+    for message in _current_turn(messages):
+        if isinstance(message, ToolMessage):
+            return "tool_result"
+        if _has_image(message):
+            return "image"
+    return None
+
+
+def prompt_key(messages: list, namespace: str) -> str:
+    """Exact key of a rendered prompt: every message plus `namespace`
+    (model and tool schemas). The system prompt names the user, so keys
+    never match across users."""
+    payload = []
+    for message in messages:
+        content = message.content
+        if message.type == "system" and isinstance(content, str):
+            content = _VOLATILE_LINES.sub("", content)
+        payload.append([
+            message.type,
+            content,
+            [[call["name"], call["args"]] for call in getattr(message, "tool_calls", None) or []],
+        ])
+    blob = json.dumps([namespace, payload], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite store of model responses with a TTL and a total size cap.
+
+    Entries older than `ttl` are ignored and purged; once the stored
+    responses exceed `max_bytes` the least recently used are evicted.
+    Each entry remembers the latency and tokens of the call that produced
+    it, so hits can be reported as time and tokens saved.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_DB_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bypassed = Counter()
+        self.saved_latency_ms = 0.0
+        self.saved_input_tokens = 0
+        self.saved_output_tokens = 0
+
+    def get(self, key: str) -> Optional[AIMessage]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT message, latency_ms, input_tokens, output_tokens FROM responses WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            self.saved_latency_ms += row[1]
+            self.saved_input_tokens += row[2]
+            self.saved_output_tokens += row[3]
+        cached = messages_from_dict(json.loads(row[0]))[0]
+        # Fresh IDs: the same answer may be replayed into several threads
+        return AIMessage(
+            content=cached.content,
+            tool_calls=[{**call, "id": f"call_{uuid.uuid4().hex}"} for call in cached.tool_calls],
+            response_metadata={**cached.response_metadata, "cached": True},
+        )
+
+    def record_bypass(self, reason: str):
+        with self._lock:
+            self.bypassed[reason] += 1
+
+    def put(self, key: str, message: AIMessage, latency_ms: float):
+        usage = message.usage_metadata or {}
+        stored = AIMessage(
+            content=message.content,
+            tool_calls=message.tool_calls,
+            response_metadata=message.response_metadata,
+        )
+        blob = json.dumps(messages_to_dict([stored]), default=str)
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, message, size, latency_ms, input_tokens, output_tokens, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, blob, len(blob), latency_ms, usage.get("input_tokens", 0),
+                 usage.get("output_tokens", 0), now, now),
+            )
+            self.stores += 1
+            self._evict(now)
+
+    def _evict(self, now: float):
+        self.conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl,))
+        evicted = self.conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "  SELECT key FROM ("
+            "    SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS kept FROM responses"
+            "  ) WHERE kept > ?"
+            ")",
+            (self.max_bytes,),
+        ).rowcount
+        self.evictions += max(evicted, 0)
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "bypassed": dict(self.bypassed),
+            "saved_latency_ms": round(self.saved_latency_ms, 1),
+            "saved_input_tokens": self.saved_input_tokens,
+            "saved_output_tokens": self.saved_output_tokens,
+        }
+
+
+class CachedChatModel:
+    """Puts an `LLMResponseCache` in front of a tool-bound chat model.
+
+    `namespace` identifies the model settings and tool schemas; changing
+    either starts a fresh set of keys. Empty answers are never stored.
+    """
+
+    def __init__(self, model, cache: LLMResponseCache, namespace: str):
+        self.model = model
+        self.cache = cache
+        self.namespace = namespace
+
+    def _lookup(self, prompt):
+        messages = prompt.to_messages()
+        reason = bypass_reason(messages)
+        if reason is not None:
+            self.cache.record_bypass(reason)
+            return None, None
+        key = prompt_key(messages, self.namespace)
+        return key, self.cache.get(key)
+
+    def _store(self, key, result, start: float):
+        if key is not None and (result.content or result.tool_calls):
+            self.cache.put(key, result, round((time.monotonic() - start) * 1000, 1))
+
+    def invoke(self, prompt, config=None):
+        key, cached = self._lookup(prompt)
+        if cached is not None:
+            return cached
+        start = time.monotonic()
+        result = self.model.invoke(prompt, config)
+        self._store(key, result, start)
+        return result
+
+    async def ainvoke(self, prompt, config=None):
+        key, cached = await asyncio.to_thread(self._lookup, prompt)
+        if cached is not None:
+            return cached
+        start = time.monotonic()
+        result = await self.model.ainvoke(prompt, config)
+        await asyncio.to_thread(self._store, key, result, start)
+        return result
+
+    def as_runnable(self) -> RunnableLambda:
+        return RunnableLambda(self.invoke, afunc=self.ainvoke, name="cached_model")
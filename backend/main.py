@@ -4,7 +4,15 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any, Union
 import json
+import hashlib
 import asyncio
+import anyio
+import itertools
+import uuid
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 import os
@@ -15,10 +23,8 @@ from typing_extensions import TypedDict, Annotated
 from datetime import datetime
 from langgraph.graph.message import add_messages
 from langchain_core.tools import tool, InjectedToolCallId
-from langchain_core.messages import ToolMessage, HumanMessage, AIMessage
+from langchain_core.messages import ToolMessage, HumanMessage, AIMessage, AIMessageChunk, trim_messages
 from langchain_core.prompts import ChatPromptTemplate
-from langgraph.prebuilt import ToolNode
-from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.graph import END, StateGraph, START
 from langgraph.prebuilt import tools_condition
 from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
@@ -30,35 +36,92 @@ from langchain_tavily import TavilySearch
 load_dotenv()
 
 # Initialize Supabase client
-from supabase import create_client
+from supabase_pool import supabase_manager, SUPABASE_HEALTH_INTERVAL
+from cache import TTLCache
+from sql_results import encode_result, paginate_query
+from schema_cache import SchemaCache
+from sql_guard import SqlGuard, SqlRejected
+from savings import estimate_savings
+from categories import CategoryRegistry
+from search import WebSearch
+from llm_cache import LLM_CACHE_ENABLED, LLMResponseCache, CachedChatModel, tools_fingerprint
+from images import ImagePipeline, ImageRejected, image_reference
+from tool_node import ParallelToolNode
+from checkpointer import create_checkpointer, checkpointer_stats, thread_leases
+from threads import thread_id_for, ThreadLocks
 
 def get_supabase_client():
-    """Create Supabase client with anon key"""
-    supabase_url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-    supabase_key = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
-    return create_client(
-        supabase_url,
-        supabase_key
-    )
+    """Get the shared, pooled Supabase client"""
+    return supabase_manager.client
+
 
 
+# User profiles rarely change; cache them so every tool call and assistant
+# turn doesn't hit the users table again
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
 
 def get_user_data(supabase, user_email: str):
     """Get user data by email"""
     try:
         if not user_email:
             raise Exception("User email is required")
+
+        # Keyed on the email exactly as queried: the users lookup is case-sensitive
+        cached = user_cache.get(user_email)
+        if cached is not None:
+            return cached
         
         user_data = supabase.table('users').select('id, user_description').eq('email', user_email).single().execute()
         if not user_data.data:
             raise Exception(f"User not found in database with email: {user_email}")
         
+        user_cache.set(user_email, user_data.data)
         return user_data.data
     except Exception as e:
         raise Exception(f"Failed to get user data: {str(e)}")
 
+# Jar categories are shared by every user and only change with migrations
+category_registry = CategoryRegistry(get_supabase_client)
+
+def invalidate_user_data(user_email: str):
+    """Drop the cached profile after the users row was written"""
+    if user_email:
+        user_cache.invalidate(user_email)
+
+# Blocking work (Supabase calls, sync tools) runs on a bounded thread pool so
+# it never stalls the event loop serving other streams and /health.
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "32"))
+
+async def supabase_health_loop():
+    """Periodically probe Supabase so pooled connections stay warm"""
+    while True:
+        await asyncio.sleep(SUPABASE_HEALTH_INTERVAL)
+        health = await asyncio.to_thread(supabase_manager.health_check)
+        if health["status"] != "healthy":
+            print(f"Supabase health check failed: {health.get('error')}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Install the bounded executor and the shared Supabase client for the lifetime of the app"""
+    executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="jargon-blocking")
+    asyncio.get_running_loop().set_default_executor(executor)
+
+    await asyncio.to_thread(supabase_manager.start)
+    await asyncio.to_thread(supabase_manager.health_check)
+    await asyncio.to_thread(schema_cache.load)
+    await asyncio.to_thread(category_registry.load)
+    health_task = asyncio.create_task(supabase_health_loop())
+    try:
+        yield
+    finally:
+        health_task.cancel()
+        supabase_manager.close()
+        executor.shutdown(wait=False, cancel_futures=True)
+
 # FastAPI app
-app = FastAPI(title="Jargon AI Chatbot API")
+app = FastAPI(title="Jargon AI Chatbot API", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -106,6 +169,9 @@ search_engine = TavilySearch(
     max_results=5,
     topic="general",
 )
+# Repeated questions ("gold price today") are answered from the cache and
+# concurrent searches are capped so the provider is not flooded
+web_search = WebSearch(search_engine)
 
 # System prompt
 
@@ -137,6 +203,7 @@ Your task is to help user with their financial management.
 - Add monthly income to user's jars with proper allocation percentages
 - Analyze receipts and products from images to make record for transactions
 - Add a specific income or expense transaction to a particular jar. You might need to classify the transaction into a jar category if the user doesn't provide it.
+- Record several transactions at once, e.g. every line item of a receipt, with one record_transactions call instead of one update_transaction call per item.
 - Set or update the user's savings target amount.
 - Predict the user's savings based on their historical savings data.
 - Search for transactions based on keywords and filters:
@@ -159,8 +226,10 @@ Your task is to help user with their financial management.
 - NOT ALWAYS mention the user's profile and transaction pattern in your response, only mention it when it's relevant to the user's question or when the user asks for it.
 """
 
+# The template is rendered by get_system_message and passed in pre-formatted,
+# so the prompt object below (and the tool binding) is built once per process
 system_prompt = ChatPromptTemplate.from_messages([
-    ("system", system_prompt_template),
+    ("system", "{system_message}"),
     ("placeholder", "{messages}"),
 ])
 
@@ -227,49 +296,34 @@ def add_monthly_income(
             'Savings': savings_percentage
         }
 
-        # Check if income entry already exists for this month
-        existing_entry = supabase.table('monthly_income_entries').select('id').eq('user_id', user_data['id']).eq('month_year', month_year_date).execute()
-        
-        if existing_entry.data:
-            response = f"Income for {month_year} already exists. Please choose a different month."
-            return Command(update={"messages": [ToolMessage(response, tool_call_id=tool_call_id)]})
-
-        # Insert monthly income entry
-        income_entry = supabase.table('monthly_income_entries').insert({
-            'user_id': user_data['id'],
-            'month_year': month_year_date,
-            'total_income_cents': income_amount_cents,
-            'allocation_percentages': allocation_percentages
+        # Retries of the same submission share a key, so the database can
+        # tell them apart from a second, different income for the month
+        idempotency_key = hashlib.sha256(json.dumps(
+            [user_data['id'], month_year_date, income_amount_cents,
+             {jar: float(percentage) for jar, percentage in allocation_percentages.items()}],
+            sort_keys=True,
+        ).encode('utf-8')).hexdigest()[:32]
+
+        # Entry and jar allocations are written in one transaction
+        result = supabase.rpc('allocate_monthly_income', {
+            'p_user_id': user_data['id'],
+            'p_month_year': month_year_date,
+            'p_total_income_cents': income_amount_cents,
+            'p_allocation_percentages': allocation_percentages,
+            'p_description': f"Monthly income allocation for {month_year}",
+            'p_idempotency_key': idempotency_key,
         }).execute()
 
-        if not income_entry.data:
+        status = (result.data or {}).get('status')
+        if status == 'exists':
+            response = f"Income for {month_year} already exists. Please choose a different month."
+            return Command(update={"messages": [ToolMessage(response, tool_call_id=tool_call_id)]})
+        if status == 'duplicate':
+            response = f"Monthly income of {income_amount_cents:,.0f} VND for {month_year} was already recorded."
+            return Command(update={"messages": [ToolMessage(response, tool_call_id=tool_call_id)]})
+        if status != 'created':
             raise Exception("Failed to create income entry")
-
-        # Get jar categories
-        jar_categories = supabase.table('jar_categories').select('id, name').execute()
-        
-        if not jar_categories.data:
-            raise Exception("Failed to fetch jar categories")
-
-        # Create income transactions for each jar
-        transactions = []
-        for category in jar_categories.data:
-            percentage = allocation_percentages.get(category['name'], 0)
-            amount = round((income_amount_cents * percentage) / 100)
-            
-            if amount > 0:
-                transactions.append({
-                    'user_id': user_data['id'],
-                    'jar_category_id': category['id'],
-                    'amount_cents': amount,
-                    'description': f"Monthly income allocation for {month_year}",
-                    'source': 'chatbot',
-                    'monthly_income_entry_id': income_entry.data[0]['id']
-                })
-
-        # Insert all transactions
-        if transactions:
-            supabase.table('transactions').insert(transactions).execute()
+        invalidate_user_queries(user_data['id'])
 
         # Format success message
         formatted_amount = f"{income_amount_cents:,.0f} VND"
@@ -295,7 +349,7 @@ def update_transaction(
     
     Args:
         amount (float): The amount of the transaction
-        jar_category_id (int): The ID of the jar category {1: Necessity, 2: Play, 3: Education, 4: Investment, 5: Charity, 6: Savings} 
+        jar_category_id (int): The ID of the jar category, from the jar categories listed in the system prompt
         user_email (str): The email of the user
         description (str): The description of the transaction
         transaction_type (str): The type of transaction (expense or income)
@@ -310,6 +364,8 @@ def update_transaction(
         supabase = get_supabase_client()
         user_data = get_user_data(supabase, user_email)
 
+        jar_name = category_registry.name_for(jar_category_id)
+
         # Get amount and apply sign based on transaction type
         amount_value = round(float(amount))
         final_amount = -amount_value if transaction_type == 'expense' else amount_value
@@ -325,10 +381,11 @@ def update_transaction(
 
         if not transaction.data:
             raise Exception("Failed to create transaction")
+        invalidate_user_queries(user_data['id'])
 
         # Format response
         formatted_amount = f"{amount_value:,.0f} VND"
-        response = f"Added {transaction_type} of {formatted_amount} to jar {jar_category_id}"
+        response = f"Added {transaction_type} of {formatted_amount} to {jar_name} jar"
         if description:
             response += f" for {description}"
         
@@ -338,6 +395,98 @@ def update_transaction(
         response = f"Error adding transaction: {str(error)}"
         return Command(update={"messages": [ToolMessage(response, tool_call_id=tool_call_id)]})
 
+class TransactionItem(BaseModel):
+    amount: float
+    jar_category_id: int
+    description: str = ""
+    transaction_type: str = "expense"
+
+# A receipt rarely has more lines; anything longer is probably a mistake
+RECORD_TRANSACTIONS_MAX_ITEMS = int(os.getenv("RECORD_TRANSACTIONS_MAX_ITEMS", "100"))
+
+def validate_transaction_item(item: TransactionItem) -> Optional[str]:
+    """Why `item` cannot be recorded, or None if it is valid"""
+    if item.transaction_type not in ('expense', 'income'):
+        return f"transaction_type must be expense or income, got {item.transaction_type!r}"
+    if not (0 < item.amount < float('inf')) or round(item.amount) == 0:
+        return "amount must be a positive number of VND"
+    if category_registry.get(item.jar_category_id) is None:
+        return f"unknown jar category ID {item.jar_category_id}"
+    return None
+
+@tool
+def record_transactions(
+    items: List[TransactionItem],
+    user_email: str,
+    tool_call_id: Annotated[str, InjectedToolCallId] = "",
+):
+    """Add several income or expense transactions in one go, for example every line item of a receipt. Classify each item into a jar category yourself.
+
+    Args:
+        items (list): The transactions; each has amount, jar_category_id (from the jar categories listed in the system prompt), description and transaction_type (expense or income)
+        user_email (str): The email of the user
+
+    returns:
+        response (str): One line per item saying whether it was recorded
+    """
+    try:
+        if not user_email:
+            raise Exception("User email is required")
+        if not items:
+            raise Exception("No items to record")
+        if len(items) > RECORD_TRANSACTIONS_MAX_ITEMS:
+            raise Exception(f"At most {RECORD_TRANSACTIONS_MAX_ITEMS} items can be recorded at once")
+
+        supabase = get_supabase_client()
+        user_data = get_user_data(supabase, user_email)
+
+        # Validate everything locally so bad items never reach the database
+        results = [None] * len(items)
+        rows = []
+        row_items = []
+        for index, item in enumerate(items):
+            problem = validate_transaction_item(item)
+            if problem:
+                results[index] = f"{index + 1}. Not recorded: {problem}"
+                continue
+            amount_value = round(float(item.amount))
+            rows.append({
+                'user_id': user_data['id'],
+                'jar_category_id': item.jar_category_id,
+                'amount_cents': -amount_value if item.transaction_type == 'expense' else amount_value,
+                'description': item.description + " created_by " + user_email,
+                'source': 'chatbot'
+            })
+            row_items.append(index)
+
+        totals = {'expense': 0, 'income': 0}
+        if rows:
+            # One multi-row insert: one round-trip and one dashboard trigger run
+            inserted = supabase.table('transactions').insert(rows).execute()
+            if not inserted.data or len(inserted.data) != len(rows):
+                raise Exception("Failed to create transactions")
+            invalidate_user_queries(user_data['id'])
+
+            for index in row_items:
+                item = items[index]
+                amount_value = round(float(item.amount))
+                totals[item.transaction_type] += amount_value
+                line = f"{index + 1}. Added {item.transaction_type} of {amount_value:,.0f} VND to {category_registry.name_for(item.jar_category_id)} jar"
+                if item.description:
+                    line += f" for {item.description}"
+                results[index] = line
+
+        response = f"Recorded {len(rows)} of {len(items)} transactions"
+        if rows:
+            response += f" (expenses {totals['expense']:,.0f} VND, income {totals['income']:,.0f} VND)"
+        response += ":\n" + "\n".join(results)
+
+        return Command(update={"messages": [ToolMessage(response, tool_call_id=tool_call_id)]})
+
+    except Exception as error:
+        response = f"Error adding transactions: {str(error)}. No transactions were recorded."
+        return Command(update={"messages": [ToolMessage(response, tool_call_id=tool_call_id)]})
+
 @tool
 def set_saving_target(
     target_amount: float,
@@ -375,6 +524,9 @@ def set_saving_target(
         if not result.data:
             raise Exception("Failed to update saving target")
 
+        invalidate_user_data(user_email)
+        invalidate_user_queries(user_data['id'])
+
         # Format the target amount for display
         formatted_target = f"{target_amount:,.0f}"
         response = f"✅ Successfully updated\n\n💰 new target: {formatted_target} VND\n\n. You can now track your savings progress on the savings chart."
@@ -383,6 +535,27 @@ def set_saving_target(
     except Exception as error:
         response = f"Error setting saving target: {str(error)}"
         return Command(update={"messages": [ToolMessage(response, tool_call_id=tool_call_id)]})
+# Per-user savings aggregates; dropped together with the user's cached queries
+SAVINGS_CACHE_TTL = float(os.getenv("SAVINGS_CACHE_TTL", "120"))
+savings_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=SAVINGS_CACHE_TTL)
+
+def get_savings_summary(supabase, user_id: int) -> dict:
+    """Get the user's savings balance and net savings per month"""
+    summary = savings_cache.get(user_id)
+    if summary is None:
+        result = supabase.rpc('get_savings_summary', {
+            'p_user_id': user_id,
+            'p_jar_category_id': category_registry.id_for('Savings'),
+        }).execute()
+        summary = result.data or {}
+        summary = {
+            "balance_cents": summary.get("balance_cents") or 0,
+            "transaction_count": summary.get("transaction_count") or 0,
+            "monthly": summary.get("monthly") or [],
+        }
+        savings_cache.set(user_id, summary)
+    return summary
+
 @tool
 def predict_savings(
     target_amount: float,
@@ -407,44 +580,39 @@ def predict_savings(
         supabase = get_supabase_client()
         user_data = get_user_data(supabase, user_email)
 
-        # Get historical savings data from transactions
-        result = supabase.table('transactions').select(
-            'amount_cents, occurred_at, jar_category_id, jar_categories(name)'
-        ).eq('user_id', user_data['id']).eq('jar_category_id', 6).order('occurred_at', desc=False).execute()
-        
-        transactions = result.data or []
+        # Balance and monthly totals are aggregated in the database
+        summary = get_savings_summary(supabase, user_data['id'])
 
-        if not transactions:
+        if not summary['transaction_count']:
             response = 'No savings data found. Please start saving money first to get predictions.'
             return Command(update={"messages": [ToolMessage(response, tool_call_id=tool_call_id)]})
 
         # Calculate current savings balance
-        current_balance = sum(tx['amount_cents'] for tx in transactions)
+        current_balance = summary['balance_cents']
         
-        # Calculate average monthly savings rate from recent transactions
-        recent_transactions = transactions[-12:]  # Last 12 transactions
-        if len(recent_transactions) >= 2:
-            total_change = sum(tx['amount_cents'] for tx in recent_transactions)
-            monthly_rate = total_change / len(recent_transactions) * 30  # Approximate monthly rate
-            
-            remaining_amount = target_amount - current_balance
-            if monthly_rate > 0:
-                months_to_target = remaining_amount / monthly_rate
-                target_date = datetime.now()
-                target_date = target_date.replace(month=target_date.month + int(months_to_target))
-                
-                response = f"Based on your current savings rate of {monthly_rate:,.0f} VND per month:\n"
-                response += f"- Current savings: {current_balance:,.0f} VND\n"
-                response += f"- Target amount: {target_amount:,.0f} VND\n"
-                response += f"- Remaining amount: {remaining_amount:,.0f} VND\n"
-                response += f"- Estimated time to reach goal: {target_date.strftime('%B %Y')}\n\n"
-                
-                if months_to_target > 24:
-                    response += "💡 Tip: Consider increasing your monthly savings or adjusting your target to reach your goal sooner."
-            else:
-                response = f"Your current savings rate is not positive. You need to save more to reach your goal of {target_amount:,.0f} VND for {target_description}."
-        else:
+        # Fit the trend of the monthly savings balance
+        estimate = estimate_savings(current_balance, summary['monthly'], target_amount)
+        if estimate is None:
             response = f"Not enough savings data to make a prediction. Current savings: {current_balance:,.0f} VND. Target: {target_amount:,.0f} VND for {target_description}."
+        elif estimate['remaining'] <= 0:
+            response = f"You have already reached your goal of {target_amount:,.0f} VND for {target_description}. Current savings: {current_balance:,.0f} VND."
+        elif estimate['target_date'] is None:
+            response = f"Your current savings rate is not positive. You need to save more to reach your goal of {target_amount:,.0f} VND for {target_description}."
+        else:
+            monthly_rate = estimate['monthly_rate']
+            response = f"Based on your savings trend of {monthly_rate:,.0f} VND per month over the last {estimate['months_used']} months:\n"
+            response += f"- Current savings: {current_balance:,.0f} VND\n"
+            response += f"- Target amount: {target_amount:,.0f} VND\n"
+            response += f"- Remaining amount: {estimate['remaining']:,.0f} VND\n"
+            response += f"- Estimated time to reach goal: {estimate['target_date'].strftime('%B %Y')}\n"
+            earliest = estimate['earliest_date'].strftime('%B %Y')
+            latest = estimate['latest_date'].strftime('%B %Y') if estimate['latest_date'] else "not within reach at the slowest recent pace"
+            if earliest != latest:
+                response += f"- Likely range ({estimate['confidence']:.0%} confidence): {earliest} to {latest}\n"
+            response += "\n"
+
+            if estimate['months_to_target'] > 24:
+                response += "💡 Tip: Consider increasing your monthly savings or adjusting your target to reach your goal sooner."
 
         return Command(update={"messages": [ToolMessage(response, tool_call_id=tool_call_id)]})
 
@@ -452,82 +620,37 @@ def predict_savings(
         response = f"Error predicting savings: {str(error)}"
         return Command(update={"messages": [ToolMessage(response, tool_call_id=tool_call_id)]})
 
-# Error handler
-def handle_tool_error(state) -> dict:
-    error = state.get("error")
-    tool_calls = state["messages"][-1].tool_calls
-    error_msg = str(error) if error else "Unknown error occurred"
-    
-    return {
-        "messages": [
-            ToolMessage(
-                content=error_msg,
-                tool_call_id=tc["id"],
-            )
-            for tc in tool_calls
-        ]
-    }
-
-# Tool node with fallback
-def create_tool_node_with_fallback(tools: list) -> dict:
-    return ToolNode(tools).with_fallbacks(
-        [RunnableLambda(handle_tool_error)], exception_key="error"
-    )
-
+# Table definitions rarely change, so they are read once and kept in memory
+schema_cache = SchemaCache(get_supabase_client)
+# Put the column lists straight into the system prompt, saving the model a
+# get_transaction_schema round-trip on analytical questions
+SCHEMA_IN_PROMPT = os.getenv("SCHEMA_IN_PROMPT", "false").lower() == "true"
 
 @tool 
 def get_transaction_schema(
     user_email: str,
+    table_name: str = "transactions",
     tool_call_id: Annotated[str, InjectedToolCallId] = ""
 ):
     """
-    Get the schema information of the transactions table
+    Get the schema information of the transactions table (or another table of the app)
 
     Args:
         user_email (str): The email of the user (required for security)
+        table_name (str): The table to describe, transactions by default
         tool_call_id (str): The tool call ID
 
     returns:
-        response (str): The schema information of the transactions table
+        response (str): The schema information of the table
     """
     try:
         if not user_email:
             raise Exception("User email is required")
 
-        # Query the schema using Postgres information_schema
-        query = """
-        SELECT 
-            column_name, 
-            data_type, 
-            is_nullable, 
-            column_default
-        FROM information_schema.columns
-        WHERE table_name = 'transactions'
-        """
-        supabase = get_supabase_client()
-        user_data = get_user_data(supabase, user_email)
-        
-        # Execute the query through RPC
-        result = supabase.rpc('run_sql', {'query': query}).execute()
-        
-        if not result.data:
+        response = schema_cache.get(table_name)
+        if not response:
             return Command(update={"messages": [ToolMessage("No schema information found", tool_call_id=tool_call_id)]})
-        
-        # Format the schema information
-        formatted_schema = ["Transactions Table Schema:"]
-        formatted_schema.append("-" * 40)
-        
-        for column in result.data:
-            column_info = [
-                f"Column: {column['column_name']}",
-                f"Type: {column['data_type']}",
-                f"Nullable: {column['is_nullable']}",
-                f"Default: {column['column_default'] or 'None'}"
-            ]
-            formatted_schema.append("\n".join(column_info))
-            formatted_schema.append("-" * 40)
-        
-        response = "\n".join(formatted_schema)
+
         return Command(update={"messages": [ToolMessage(response, tool_call_id=tool_call_id)]})
 
     except Exception as error:
@@ -535,19 +658,46 @@ def get_transaction_schema(
         return Command(update={"messages": [ToolMessage(response, tool_call_id=tool_call_id)]})
     
 
+# Results of read-only queries, per user. Any chatbot write for that user
+# drops them; the TTL covers writes made elsewhere (e.g. the web app).
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", "120"))
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "512"))
+sql_cache = TTLCache(maxsize=SQL_CACHE_SIZE, ttl=SQL_CACHE_TTL)
+# Bumped on every write so a query that was already running when the data
+# changed stores its result under a version nobody reads any more. Versions
+# come from one counter, so an expired entry is never handed out again, and
+# outlive every result that could have been cached under the old one.
+user_data_versions = TTLCache(maxsize=max(SQL_CACHE_SIZE * 64, 65536), ttl=2 * SQL_CACHE_TTL)
+_data_version_counter = itertools.count(1)
+sql_guard = SqlGuard()
+
+def invalidate_user_queries(user_id: int):
+    """Forget cached query results and summaries after the user's data changed"""
+    user_data_versions.set(user_id, next(_data_version_counter))
+    savings_cache.invalidate(user_id)
+    dropped = sql_cache.invalidate_where(lambda key: key[0] == user_id)
+    if dropped:
+        print(f"Invalidated {dropped} cached queries for user {user_id}")
+
 @tool
 def sql_executor(
     sql_query: str,
     user_email: str,
+    offset: int = 0,
     tool_call_id: Annotated[str, InjectedToolCallId] = "",
 ):
     """
     Execute a SQL query and return the result. Only SELECT queries are allowed.
     The query must include user_id filter for security.
+    Results come back one page at a time as column names plus rows; when
+    has_more is true, call again with offset set to next_offset to read further.
+    Only queries with an ORDER BY (ending in a unique column such as id) can be
+    paged, since Postgres returns unordered rows in no fixed order.
 
     Args:
         sql_query (str): The SQL query to execute (SELECT only)
         user_email (str): The email of the user (required for security)
+        offset (int): Row of the result to start from; 0 for the first page
         tool_call_id (str): The tool call ID
 
     returns:
@@ -557,52 +707,62 @@ def sql_executor(
         if not user_email:
             raise Exception("User email is required")
 
-        # Validate query is SELECT only
-        sql_query = sql_query.strip()
-        if not sql_query.lower().startswith('select'):
-            raise Exception("Only SELECT queries are allowed")
-
         # Get user data for security check
         supabase = get_supabase_client()
         user_data = get_user_data(supabase, user_email)
         user_id = user_data['id']
 
-        # Execute query
-        result = supabase.rpc('run_sql', {
-            'query': sql_query,
-        }).execute()
-
-        if not result.data:
-            return {
-                "status": "success",
-                "message": "No results found",
-                "data": []
-            }
-
-        # Format results as JSON
-        if isinstance(result.data, list):
-            # Process each row to format numbers and dates
-            formatted_data = []
-            for row in result.data:
-                formatted_row = {}
-                for key, val in row.items():
-                    if isinstance(val, (int, float)):
-                        # Format numbers with commas
-                        formatted_row[key] = f"{val:,}"
-                    elif isinstance(val, datetime):
-                        # Format datetime objects
-                        formatted_row[key] = val.isoformat()
-                    else:
-                        formatted_row[key] = str(val)
-                formatted_data.append(formatted_row)
-
-            return {
-                "status": "success",
-                "message": "Query executed successfully",
-                "data": formatted_data,
-                "total_rows": len(formatted_data)
-            }
-
+        # Parse locally: single SELECT, scoped to this user, row count capped
+        guarded_sql = sql_guard.prepare(sql_query, user_id)
+        sql_guard.check_page(sql_query, offset)
+
+        # Serve repeated questions from memory
+        cache_key = (user_id, user_data_versions.get(user_id, 0), guarded_sql, offset)
+        response = sql_cache.get(cache_key)
+        if response is None:
+            sql_guard.check_cost(guarded_sql, supabase)
+
+            # Execute query, letting Postgres cut the result down to one page
+            result = supabase.rpc('run_sql', {
+                'query': paginate_query(guarded_sql, offset),
+            }).execute()
+            rows = result.data if isinstance(result.data, list) else []
+
+            if not rows:
+                response = {
+                    "status": "success",
+                    "message": "No results found" if offset == 0 else "No more rows",
+                    "data": []
+                }
+            else:
+                data = encode_result(rows, offset)
+                message = "Query executed successfully"
+                if data.get("truncated"):
+                    message += (f"; showing {len(data['rows'])} of the {data['row_count']} rows fetched for this page,"
+                                " summary covers only those rows")
+                if data["has_more"] and not sql_guard.is_ordered(sql_query):
+                    # OFFSET pages of an unordered query may repeat or skip rows
+                    data["next_offset"] = None
+                    message += ("; more rows exist, but this query has no ORDER BY: to page through them, "
+                                "run it again with an ORDER BY ending in a unique column such as id")
+                elif data["has_more"]:
+                    message += f"; more rows available with offset={data['next_offset']}"
+                response = {
+                    "status": "success",
+                    "message": message,
+                    "data": data,
+                    "rows_returned": len(data["rows"])
+                }
+            sql_cache.set(cache_key, response)
+
+        return response
+
+    except SqlRejected as error:
+        return {
+            "status": "error",
+            "message": f"Query rejected ({error.reason}): {str(error)}",
+            "data": None
+        }
     except Exception as error:
         return {
             "status": "error",
@@ -611,7 +771,7 @@ def sql_executor(
         }
 
 @tool
-def search_web(
+async def search_web(
     query: str,
     tool_call_id: Annotated[str, InjectedToolCallId] = "",
 ):
@@ -626,7 +786,7 @@ def search_web(
         response (str): The result of the web search.
     """
     try:
-        result = search_engine.invoke(query)
+        result = await web_search.search(query)
         return result
     except Exception as error:
         return {
@@ -638,6 +798,7 @@ def search_web(
 tools = [
     add_monthly_income,
     update_transaction,
+    record_transactions,
     set_saving_target,
     get_transaction_schema,
     sql_executor,
@@ -645,15 +806,31 @@ tools = [
     search_web,
 ]
 
-def get_assistant_runnable(state):
+# Built once: re-binding eight tool schemas on every assistant step is wasted work
+bound_llm = llm.bind_tools(tools)
+# temperature=0 answers to the same prompt are reused when LLM_CACHE_ENABLED=true
+llm_cache = LLMResponseCache() if LLM_CACHE_ENABLED else None
+if llm_cache is not None:
+    bound_llm = CachedChatModel(
+        bound_llm, llm_cache, f"{llm.model}:{llm.temperature}:{tools_fingerprint(tools)}"
+    ).as_runnable()
+assistant_runnable = system_prompt | bound_llm
+
+# Time fields change every turn, everything else only when the user's profile does
+_CURRENT_TIME = "\x00current_time\x00"
+_CURRENT_DATE = "\x00current_date\x00"
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "1024"))
+prompt_cache = TTLCache(maxsize=PROMPT_CACHE_SIZE, ttl=24 * 3600)
+
+def get_system_message(state) -> str:
+    """Render the system prompt for the user in `state`.
+
+    The user-specific part is cached per (email, description version); only
+    the current time and date are substituted on every turn.
+    """
     # Extract user_email from state
     user_email = state.get("user_email", "unknown@example.com")
     
-    # Get current date and time
-    now = datetime.now()
-    current_time = now.strftime("%H:%M")
-    current_date = now.strftime("%B %d, %Y")
-    
     # Get user data including description
     try:
         supabase = get_supabase_client()
@@ -661,53 +838,220 @@ def get_assistant_runnable(state):
         user_description = user_data.get('user_description', 'No user description available.')
     except Exception as e:
         user_description = 'Failed to fetch user description.'
+
+    key = (user_email, hash(user_description))
+    rendered = prompt_cache.get(key)
+    if rendered is None:
+        rendered = system_prompt_template.format(
+            user_email=user_email,
+            current_time=_CURRENT_TIME,
+            current_date=_CURRENT_DATE,
+            user_description=user_description,
+        )
+        prompt_cache.set(key, rendered)
     
-    # Format the system prompt with the user's email, description and current time
-    formatted_prompt = system_prompt.partial(
-        user_email=user_email,
-        current_time=current_time,
-        current_date=current_date,
-        user_description=user_description
+    # Get current date and time
+    now = datetime.now()
+    system_message = (
+        rendered
+        .replace(_CURRENT_TIME, now.strftime("%H:%M"))
+        .replace(_CURRENT_DATE, now.strftime("%B %d, %Y"))
     )
-    
-    # Return the runnable with the formatted prompt
-    return formatted_prompt | llm.bind_tools(tools)
+    if category_registry.ensure_loaded():
+        system_message += f"\n## Jar categories (ID: name)\n{category_registry.describe()}\n"
+    if SCHEMA_IN_PROMPT:
+        schema = schema_cache.compact()
+        if schema:
+            system_message += (
+                "\n## Database schema (already loaded, no need to call get_transaction_schema)\n"
+                + schema + "\n"
+            )
+    return system_message
+
+# Older turns beyond this many (approximate) tokens are left out of the prompt;
+# the full, bounded history stays in the checkpointer
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "8000"))
+IMAGE_TOKEN_ESTIMATE = 258
+
+def estimate_tokens(messages) -> int:
+    """Rough token count (~4 characters per token, fixed cost per image)"""
+    total = 0
+    for message in messages:
+        content = message.content
+        blocks = content if isinstance(content, list) else [content]
+        for block in blocks:
+            if isinstance(block, str):
+                total += len(block) // 4
+            elif isinstance(block, dict) and block.get("type") == "image_url":
+                total += IMAGE_TOKEN_ESTIMATE
+            elif isinstance(block, dict):
+                total += len(str(block.get("text", ""))) // 4
+        for tool_call in getattr(message, "tool_calls", None) or []:
+            total += len(json.dumps(tool_call.get("args", {}), default=str)) // 4
+        total += 4
+    return total
+
+def window_messages(messages: list, budget: int = CHAT_HISTORY_TOKEN_BUDGET) -> list:
+    """Always keep the current turn, fill the rest of the budget with the
+    most recent earlier turns"""
+    last_human = max(
+        (i for i, message in enumerate(messages) if isinstance(message, HumanMessage)),
+        default=0,
+    )
+    history, current = messages[:last_human], messages[last_human:]
+    remaining = budget - estimate_tokens(current)
+    if not history or remaining <= 0:
+        return current
+    kept = trim_messages(
+        history,
+        max_tokens=remaining,
+        token_counter=estimate_tokens,
+        strategy="last",
+        start_on="human",
+    )
+    return kept + current
+
+# Retry policy for empty model responses
+ASSISTANT_MAX_ATTEMPTS = int(os.getenv("ASSISTANT_MAX_ATTEMPTS", "3"))
+ASSISTANT_DEADLINE_S = float(os.getenv("ASSISTANT_DEADLINE_S", "60"))
+ASSISTANT_BACKOFF_BASE_S = float(os.getenv("ASSISTANT_BACKOFF_BASE_S", "0.5"))
+
+class AssistantBudgetExceeded(Exception):
+    """The model did not produce a usable answer within the retry budget"""
+
+class AssistantMetrics:
+    """Per-invocation counters for the assistant node"""
+    def __init__(self, window: int = 1000):
+        self.invocations = 0
+        self.attempts = 0
+        self.budget_exhausted = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.latency_ms = deque(maxlen=window)
+
+    def record(self, attempts: int, latency_ms: float, results: list, exhausted: bool = False):
+        self.invocations += 1
+        self.attempts += attempts
+        self.budget_exhausted += int(exhausted)
+        self.latency_ms.append(latency_ms)
+        for result in results:
+            usage = getattr(result, "usage_metadata", None) or {}
+            self.input_tokens += usage.get("input_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+        # Only the unusual steps are logged; the rest is in /api/stats
+        if attempts > 1 or exhausted:
+            print(f"Assistant invocation: attempts={attempts} latency={latency_ms:.0f}ms exhausted={exhausted}")
+
+    def stats(self) -> dict:
+        return {
+            "invocations": self.invocations,
+            "attempts": self.attempts,
+            "retries": self.attempts - self.invocations,
+            "budget_exhausted": self.budget_exhausted,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "latency_ms": StreamMetrics._summary(self.latency_ms),
+        }
+
+assistant_metrics = AssistantMetrics()
 
 # Assistant class
 class Assistant:
-    def __init__(self, runnable_getter):
-        self.runnable_getter = runnable_getter
+    def __init__(self, runnable, system_message_getter,
+                 max_attempts: int = ASSISTANT_MAX_ATTEMPTS,
+                 deadline_s: float = ASSISTANT_DEADLINE_S,
+                 backoff_base_s: float = ASSISTANT_BACKOFF_BASE_S):
+        self.runnable = runnable
+        self.system_message_getter = system_message_getter
+        self.max_attempts = max_attempts
+        self.deadline_s = deadline_s
+        self.backoff_base_s = backoff_base_s
+
+    @staticmethod
+    def _is_empty(result) -> bool:
+        return not result.tool_calls and (
+            not result.content
+            or isinstance(result.content, list)
+            and not result.content[0].get("text")
+        )
+
+    @staticmethod
+    def _prompt_state(state: State, system_message: str) -> dict:
+        """State as sent to the LLM: history windowed to the token budget"""
+        return {**state, "messages": window_messages(state["messages"]), "system_message": system_message}
+
+    @staticmethod
+    def _reprompt(state: dict) -> dict:
+        # If the LLM happens to return an empty response, we will re-prompt it
+        # for an actual response.
+        return {**state, "messages": state["messages"] + [("user", "Respond with a real output.")]}
+
+    def _backoff(self, attempt: int) -> float:
+        return self.backoff_base_s * (2 ** (attempt - 1))
+
+    def _exhausted(self, attempts: int, start: float, results: list, reason: str):
+        assistant_metrics.record(attempts, round((time.monotonic() - start) * 1000, 1), results, exhausted=True)
+        raise AssistantBudgetExceeded(f"{reason} after {attempts} attempt(s)")
 
     def __call__(self, state: State, config: RunnableConfig):
-        # Get the runnable with the user's email from state
-        runnable = self.runnable_getter(state)
-        
-        while True:
+        start = time.monotonic()
+        # Render the system prompt for the user's email from state
+        state = self._prompt_state(state, self.system_message_getter(state))
+        results = []
+
+        for attempt in range(1, self.max_attempts + 1):
             # Pass the full state including conversation history
-            result = runnable.invoke(state)
-            # If the LLM happens to return an empty response, we will re-prompt it
-            # for an actual response.
-            if not result.tool_calls and (
-                not result.content
-                or isinstance(result.content, list)
-                and not result.content[0].get("text")
-            ):
-                messages = state["messages"] + [("user", "Respond with a real output.")]
-                state = {**state, "messages": messages}
-            else:
+            result = self.runnable.invoke(state, config)
+            results.append(result)
+            if not self._is_empty(result):
+                assistant_metrics.record(attempt, round((time.monotonic() - start) * 1000, 1), results)
+                return {"messages": result}
+            delay = self._backoff(attempt)
+            if attempt == self.max_attempts or time.monotonic() + delay - start > self.deadline_s:
                 break
-        return {"messages": result}
+            time.sleep(delay)
+            state = self._reprompt(state)
+        self._exhausted(len(results), start, results, "No usable response from the model")
+
+    async def acall(self, state: State, config: RunnableConfig):
+        start = time.monotonic()
+        # The user lookup may talk to Supabase, keep it off the event loop
+        system_message = await asyncio.to_thread(self.system_message_getter, state)
+        state = self._prompt_state(state, system_message)
+        results = []
+
+        for attempt in range(1, self.max_attempts + 1):
+            remaining = self.deadline_s - (time.monotonic() - start)
+            try:
+                result = await asyncio.wait_for(self.runnable.ainvoke(state, config), timeout=remaining)
+            except asyncio.TimeoutError:
+                self._exhausted(attempt, start, results, f"Model did not answer within {self.deadline_s:g}s")
+            results.append(result)
+            if not self._is_empty(result):
+                assistant_metrics.record(attempt, round((time.monotonic() - start) * 1000, 1), results)
+                return {"messages": result}
+            delay = self._backoff(attempt)
+            if attempt == self.max_attempts or time.monotonic() + delay - start > self.deadline_s:
+                break
+            await asyncio.sleep(delay)
+            state = self._reprompt(state)
+        self._exhausted(len(results), start, results, "No usable response from the model")
 
 builder = StateGraph(State)
-builder.add_node("assistant", Assistant(get_assistant_runnable))
-builder.add_node("tools", create_tool_node_with_fallback(tools))
+assistant = Assistant(assistant_runnable, get_system_message)
+builder.add_node("assistant", RunnableLambda(assistant, afunc=assistant.acall))
+# Several tool calls in one step (e.g. one update_transaction per receipt
+# item) run concurrently, each with its own error handling
+builder.add_node("tools", ParallelToolNode(tools).as_runnable())
 builder.add_edge(START, "assistant")
 builder.add_conditional_edges("assistant", tools_condition)
 builder.add_edge("tools", "assistant")
 builder.add_edge("assistant", END)
 
-memory = InMemorySaver()
+memory = create_checkpointer()
 graph = builder.compile(checkpointer=memory)
+# Leases in the checkpoint database extend the per-thread lock across worker processes
+thread_locks = ThreadLocks(leases=thread_leases(memory))
 
 # FastAPI endpoints
 @app.get("/")
@@ -716,7 +1060,41 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "supabase": supabase_manager.stats(),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """In-process cache and pool counters"""
+    return {
+        "user_cache": user_cache.stats(),
+        "prompt_cache": prompt_cache.stats(),
+        "sql_cache": sql_cache.stats(),
+        "savings_cache": savings_cache.stats(),
+        "schema_cache": schema_cache.stats(),
+        "jar_categories": category_registry.stats(),
+        "sql_guard": sql_guard.stats(),
+        "web_search": web_search.stats(),
+        "llm_cache": llm_cache.stats() if llm_cache is not None else {"enabled": False},
+        "images": image_pipeline.stats(),
+        "chat_stream": stream_metrics.stats(),
+        "assistant": assistant_metrics.stats(),
+        "checkpointer": checkpointer_stats(memory),
+        "thread_locks": thread_locks.stats(),
+    }
+
+@app.post("/schema/refresh")
+async def refresh_schema():
+    """Reload the cached table definitions and jar categories after a migration"""
+    try:
+        tables = await asyncio.to_thread(schema_cache.refresh)
+        categories = await asyncio.to_thread(category_registry.refresh)
+        return {"status": "refreshed", "tables": sorted(tables), "jar_categories": len(categories)}
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Schema refresh failed: {e}")
 
 # Debug print function
 def _print_event(event: dict, _printed: set, max_length=1500):
@@ -741,140 +1119,284 @@ def _print_event(event: dict, _printed: set, max_length=1500):
 
             _printed.add(message.id)
 
+# Events are flushed as soon as the graph produces them. Clients that want the
+# old step-by-step feel can hold each thinking step for `pace_ms`.
+TOOL_CALL_PACE_MS = 300
+TOOL_RESULT_PACE_MS = 200
+
+class StreamMetrics:
+    """Rolling time-to-first-byte / time-to-final samples across requests"""
+    def __init__(self, window: int = 1000):
+        self.ttfb_ms = deque(maxlen=window)
+        self.final_ms = deque(maxlen=window)
+        self.requests = 0
+
+    def record(self, timings: dict):
+        self.requests += 1
+        if timings.get("ttfb_ms") is not None:
+            self.ttfb_ms.append(timings["ttfb_ms"])
+        if timings.get("final_ms") is not None:
+            self.final_ms.append(timings["final_ms"])
+
+    @staticmethod
+    def _summary(samples) -> dict:
+        if not samples:
+            return {"count": 0}
+        ordered = sorted(samples)
+        return {
+            "count": len(ordered),
+            "p50": ordered[len(ordered) // 2],
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1],
+        }
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "ttfb_ms": self._summary(self.ttfb_ms),
+            "final_ms": self._summary(self.final_ms),
+        }
+
+stream_metrics = StreamMetrics()
+
+class StreamTimer:
+    """Formats SSE events for one request and measures when they went out"""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.ttfb_ms = None
+        self.final_ms = None
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.start) * 1000, 1)
+
+    def emit(self, payload: dict) -> str:
+        if self.ttfb_ms is None:
+            self.ttfb_ms = self._elapsed_ms()
+        if payload.get("type") == "final":
+            self.final_ms = self._elapsed_ms()
+        return f"data: {json.dumps(payload)}\n\n"
+
+    def finish(self) -> dict:
+        timings = {"ttfb_ms": self.ttfb_ms, "final_ms": self.final_ms, "total_ms": self._elapsed_ms()}
+        stream_metrics.record(timings)
+        print(f"Stream timings: {timings}")
+        return timings
+
+def _message_text(content) -> str:
+    """Text of a message or chunk whose content may be a list of blocks"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block if isinstance(block, str) else block.get("text", "")
+            for block in content
+            if isinstance(block, (str, dict))
+        )
+    return ""
+
+# Uploaded photos are shrunk before they reach the model or the checkpointer
+image_pipeline = ImagePipeline()
+
+async def drop_image_from_history(config: dict, image_message: HumanMessage, prepared_image):
+    """Replace the turn's image with a short reference once the model has seen it"""
+    try:
+        snapshot = await graph.aget_state(config)
+        if any(message.id == image_message.id for message in snapshot.values.get("messages", [])):
+            await graph.aupdate_state(config, {"messages": [
+                HumanMessage(content=[image_message.content[0], image_reference(prepared_image)], id=image_message.id)
+            ]})
+    except Exception as error:
+        print(f"Could not drop image {prepared_image.sha256[:12]} from history: {error}")
+
 # Streaming event generator
 async def generate_chat_stream(request: ChatRequest):
+    timer = StreamTimer()
     try:
         if not request.user_email:
-            yield f"data: {json.dumps({'type': 'error', 'content': 'User email is required'})}\n\n"
+            yield timer.emit({'type': 'error', 'content': 'User email is required'})
+            timer.finish()
             return
             
         print(f"\n=== Starting streaming request for user: {request.user_email} ===")
         print(f"User message: {request.message}")
         print(f"History length: {len(request.conversation_history)}")
+
+        prepared_image = None
+        if request.image_data and request.image_format:
+            try:
+                prepared_image = await asyncio.to_thread(image_pipeline.prepare, request.image_data)
+            except ImageRejected as error:
+                yield timer.emit({'type': 'error', 'content': f'Could not use the image: {error}'})
+                timer.finish()
+                return
+            print(f"Image {prepared_image.sha256[:12]}: {prepared_image.original_bytes} -> {prepared_image.bytes} bytes, "
+                  f"{prepared_image.width}x{prepared_image.height}")
         
-        # Create a unique thread ID for this conversation
-        if request.new_thread:
-            # Generate a completely new thread ID with timestamp to ensure uniqueness
-            thread_id = f"user_{hash(request.user_email + str(datetime.now().timestamp())) % 10000}"
-            print(f"Created new thread ID: {thread_id} (conversation cleared)")
-        else:
-            # Use consistent thread ID for continuing conversation
-            thread_id = f"user_{hash(request.user_email) % 10000}"
-            print(f"Using existing thread ID: {thread_id}")
+        # Stable, collision-free thread ID shared by every worker process
+        thread_id = thread_id_for(request.user_email)
+
+        # Requests on the same thread are serialized so they don't race the checkpointer
+        async with thread_locks.hold(thread_id):
+            if request.new_thread:
+                # Start the conversation over by dropping the thread's checkpoints
+                await memory.adelete_thread(thread_id)
+                print(f"Cleared thread ID: {thread_id} (conversation cleared)")
+            else:
+                print(f"Using existing thread ID: {thread_id}")
 
-        config = {
-            "configurable": {
-                "thread_id": thread_id,
+            config = {
+                "configurable": {
+                    "thread_id": thread_id,
+                }
             }
-        }
 
-        # Build conversation context
-        messages = []
-        for msg in request.conversation_history:
-            if msg.role == "user":
-                messages.append(HumanMessage(content=msg.content))
-            elif msg.role == "assistant":
-                messages.append(AIMessage(content=msg.content))
-        
-        # Add current message with image if provided
-        if request.image_data and request.image_format:
-            # Create a multimodal message with text and image
-            content = [
-                {"type": "text", "text": request.message},
-                {"type": "image_url", "image_url": f"data:{request.image_format};base64,{request.image_data}"}
-            ]
-            messages.append(HumanMessage(content=content))
-        else:
-            # Text-only message
-            messages.append(HumanMessage(content=request.message))
+            # The checkpointer already holds this thread's history, so only
+            # the new message is sent. The client's conversation_history is
+            # used only to seed a thread that has no checkpoint yet.
+            messages = []
+            snapshot = await graph.aget_state(config)
+            if snapshot.values.get("messages"):
+                print(f"Using checkpointed history ({len(snapshot.values['messages'])} messages)")
+            else:
+                for msg in request.conversation_history:
+                    if msg.role == "user":
+                        messages.append(HumanMessage(content=msg.content))
+                    elif msg.role == "assistant":
+                        messages.append(AIMessage(content=msg.content))
         
-        # Create state with user email
-        initial_state = {
-            "messages": messages,
-            "user_email": request.user_email
-        }
+            # Add current message with image if provided
+            image_message = None
+            if prepared_image is not None:
+                # Create a multimodal message with text and image; the ID lets
+                # the image be swapped for a reference once the turn is over
+                content = [
+                    {"type": "text", "text": request.message},
+                    {"type": "image_url", "image_url": prepared_image.data_url}
+                ]
+                image_message = HumanMessage(content=content, id=str(uuid.uuid4()))
+                messages.append(image_message)
+            else:
+                # Text-only message
+                messages.append(HumanMessage(content=request.message))
         
-        # Stream the graph execution
-        events = graph.stream(initial_state, config, stream_mode="values")
+            # Create state with user email
+            initial_state = {
+                "messages": messages,
+                "user_email": request.user_email
+            }
         
-        # Track printed events and process stream
-        _printed = set()
-        step_count = 0
+            # Stream the graph execution asynchronously; sync tools are dispatched
+            # to the bounded executor by the ToolNode. "messages" mode carries the
+            # LLM token chunks, "values" the full state after each node.
+            events = graph.astream(initial_state, config, stream_mode=["values", "messages"])
+            try:
+                # Track printed events and process stream
+                _printed = set()
+                step_count = 0
         
-        for event in events:
-            # Print event for tracking
-            _print_event(event, _printed)
+                async for mode, event in events:
+                    if mode == "messages":
+                        message_chunk, metadata = event
+                        # Forward answer tokens as they arrive; tool-call chunks are
+                        # reported as thinking steps once the message is complete
+                        if (
+                            metadata.get("langgraph_node") == "assistant"
+                            and isinstance(message_chunk, AIMessageChunk)
+                            and not message_chunk.tool_call_chunks
+                        ):
+                            text = _message_text(message_chunk.content)
+                            if text:
+                                yield timer.emit({'type': 'delta', 'content': text, 'message_id': message_chunk.id})
+                        continue
+
+                    # Print event for tracking
+                    _print_event(event, _printed)
             
-            if "messages" in event and event["messages"]:
-                last_message = event["messages"][-1]
+                    if "messages" in event and event["messages"]:
+                        last_message = event["messages"][-1]
                 
-                # Handle tool calls (thinking steps)
-                if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-                    step_count += 1
-                    for tool_call in last_message.tool_calls:
-                        # Create more descriptive thinking content based on tool name
-                        tool_name = tool_call['name']
-                        tool_args = tool_call.get('args', {})
+                        # Handle tool calls (thinking steps)
+                        if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
+                            step_count += 1
+                            for tool_call in last_message.tool_calls:
+                                # Create more descriptive thinking content based on tool name
+                                tool_name = tool_call['name']
+                                tool_args = tool_call.get('args', {})
                         
-                        if tool_name == 'add_monthly_income':
-                            thinking_content = f"Adding monthly income of {tool_args.get('monthly_income_amount', 'unknown')} VND to user's jars"
-                        elif tool_name == 'update_transaction':
-                            thinking_content = f"Recording {tool_args.get('transaction_type', 'transaction')} of {tool_args.get('amount', 'unknown')} VND"
-                        elif tool_name == 'set_saving_target':
-                            thinking_content = f"Setting savings target to {tool_args.get('target_amount', 'unknown')} VND"
-                        elif tool_name == 'predict_savings':
-                            thinking_content = f"Analyzing savings data to predict when you can reach {tool_args.get('target_amount', 'your goal')}"
-                        elif tool_name == 'get_transaction_schema':
-                            thinking_content = "Examining transaction database structure to understand your data"
-                        elif tool_name == 'sql_executor':
-                            thinking_content = "Searching through your transaction history to find relevant information"
-                        else:
-                            thinking_content = f"Using {tool_name} with parameters: {str(tool_args)[:50]}"
+                                if tool_name == 'add_monthly_income':
+                                    thinking_content = f"Adding monthly income of {tool_args.get('monthly_income_amount', 'unknown')} VND to user's jars"
+                                elif tool_name == 'update_transaction':
+                                    thinking_content = f"Recording {tool_args.get('transaction_type', 'transaction')} of {tool_args.get('amount', 'unknown')} VND"
+                                elif tool_name == 'record_transactions':
+                                    thinking_content = f"Recording {len(tool_args.get('items') or [])} transactions in one go"
+                                elif tool_name == 'set_saving_target':
+                                    thinking_content = f"Setting savings target to {tool_args.get('target_amount', 'unknown')} VND"
+                                elif tool_name == 'predict_savings':
+                                    thinking_content = f"Analyzing savings data to predict when you can reach {tool_args.get('target_amount', 'your goal')}"
+                                elif tool_name == 'get_transaction_schema':
+                                    thinking_content = "Examining transaction database structure to understand your data"
+                                elif tool_name == 'sql_executor':
+                                    thinking_content = "Searching through your transaction history to find relevant information"
+                                else:
+                                    thinking_content = f"Using {tool_name} with parameters: {str(tool_args)[:50]}"
                         
-                        # Truncate to first 20 words
-                        words = thinking_content.split()[:20]
-                        truncated_thinking = " ".join(words) + ("..." if len(thinking_content.split()) > 20 else "")
+                                # Truncate to first 20 words
+                                words = thinking_content.split()[:20]
+                                truncated_thinking = " ".join(words) + ("..." if len(thinking_content.split()) > 20 else "")
                         
-                        yield f"data: {json.dumps({'type': 'thinking', 'content': truncated_thinking, 'step': step_count})}\n\n"
-                        await asyncio.sleep(0.3)  # Slightly longer delay for better readability
+                                yield timer.emit({'type': 'thinking', 'content': truncated_thinking, 'step': step_count, 'pace_ms': TOOL_CALL_PACE_MS})
                 
-                # Handle tool responses (intermediate steps)
-                elif isinstance(last_message, ToolMessage):
-                    step_count += 1
-                    # Create more meaningful processing messages
-                    content = last_message.content
-                    if "successfully" in content.lower():
-                        thinking_content = "✅ Task completed successfully, preparing response"
-                    elif "error" in content.lower():
-                        thinking_content = "⚠️ Encountered an issue, trying alternative approach"
-                    elif "found" in content.lower() or "results" in content.lower():
-                        thinking_content = "📊 Found relevant data, analyzing results"
-                    else:
-                        thinking_content = f"Processing: {content[:80]}"
+                        # Handle tool responses (intermediate steps)
+                        elif isinstance(last_message, ToolMessage):
+                            step_count += 1
+                            # Create more meaningful processing messages
+                            content = last_message.content
+                            if "successfully" in content.lower():
+                                thinking_content = "✅ Task completed successfully, preparing response"
+                            elif "error" in content.lower():
+                                thinking_content = "⚠️ Encountered an issue, trying alternative approach"
+                            elif "found" in content.lower() or "results" in content.lower():
+                                thinking_content = "📊 Found relevant data, analyzing results"
+                            else:
+                                thinking_content = f"Processing: {content[:80]}"
                     
-                    # Truncate to first 20 words
-                    words = thinking_content.split()[:20]
-                    truncated_thinking = " ".join(words) + ("..." if len(thinking_content.split()) > 20 else "")
+                            # Truncate to first 20 words
+                            words = thinking_content.split()[:20]
+                            truncated_thinking = " ".join(words) + ("..." if len(thinking_content.split()) > 20 else "")
                     
-                    yield f"data: {json.dumps({'type': 'thinking', 'content': truncated_thinking, 'step': step_count})}\n\n"
-                    await asyncio.sleep(0.2)
+                            yield timer.emit({'type': 'thinking', 'content': truncated_thinking, 'step': step_count, 'pace_ms': TOOL_RESULT_PACE_MS})
                 
-                # Handle final AI response
-                elif isinstance(last_message, AIMessage) and last_message.content and not (hasattr(last_message, 'tool_calls') and last_message.tool_calls):
-                    print(f"\n=== Final response generated ===")
-                    print(f"Response length: {len(last_message.content)}")
-                    yield f"data: {json.dumps({'type': 'final', 'content': last_message.content})}\n\n"
-                    break
-        
+                        # Handle final AI response
+                        elif isinstance(last_message, AIMessage) and last_message.content and not (hasattr(last_message, 'tool_calls') and last_message.tool_calls):
+                            print(f"\n=== Final response generated ===")
+                            print(f"Response length: {len(last_message.content)}")
+                            yield timer.emit({'type': 'final', 'content': last_message.content})
+                            # Keep draining so the final checkpoint is written
+                            # before the thread lock is released
+            finally:
+                if image_message is not None:
+                    # Runs on errors and client disconnects too, while the thread
+                    # is still locked, so the image never outlives its turn
+                    with anyio.CancelScope(shield=True):
+                        # Stop the graph first so nothing writes after the swap
+                        await events.aclose()
+                        await drop_image_from_history(config, image_message, prepared_image)
+
         print(f"\n=== Stream completed successfully ===")
         print(f"Total thinking steps: {step_count}")
-        yield f"data: {json.dumps({'type': 'done'})}\n\n"
+        yield timer.emit({'type': 'done', 'timings': timer.finish()})
         
+    except AssistantBudgetExceeded as error:
+        print(f"\n=== Assistant budget exhausted: {error} ===")
+        yield timer.emit({'type': 'error', 'content': "Sorry, I couldn't put together an answer in time. Please try again.", 'reason': 'budget_exhausted'})
+        timer.finish()
+
     except Exception as error:
         print(f"\n=== Streaming error ===")
         print(f"Error details: {error}")
         print(f"Error type: {type(error).__name__}")
-        yield f"data: {json.dumps({'type': 'error', 'content': f'Failed to process request: {str(error)}'})}\n\n"
+        yield timer.emit({'type': 'error', 'content': f'Failed to process request: {str(error)}'})
+        timer.finish()
 
 @app.post("/chat/stream")
 async def chat_stream_endpoint(request: ChatRequest):
@@ -886,6 +1408,7 @@ async def chat_stream_endpoint(request: ChatRequest):
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "Content-Type": "text/event-stream",
+            "X-Accel-Buffering": "no",  # don't let proxies batch our events
         }
     )
 
@@ -0,0 +1,105 @@
+"""Savings trend estimation for predict_savings"""
+import calendar
+import math
+from datetime import date
+from statistics import NormalDist
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Give up on dates further out than this; the trend means nothing by then
+MAX_FORECAST_MONTHS = 1200
+
+
+def add_months(day: date, months: int) -> date:
+    """Calendar-aware month addition; the day is clamped to the month's length"""
+    index = day.month - 1 + months
+    year = day.year + index // 12
+    month = index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _month_start(value) -> date:
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return date(value.year, value.month, 1)
+
+
+def monthly_series(monthly: list, today: date) -> Tuple[Optional[date], np.ndarray]:
+    """Resample `[{"month", "net_cents"}]` rows to one value per calendar month.
+
+    Returns the first month and the series, which runs up to and including
+    the current month; months without transactions count as zero.
+    """
+    if not monthly:
+        return None, np.zeros(0)
+    current = _month_start(today)
+    starts = [_month_start(row["month"]) for row in monthly]
+    first = min(starts)
+    index = np.array([(m.year - first.year) * 12 + m.month - first.month for m in starts])
+    values = np.array([float(row["net_cents"] or 0) for row in monthly])
+    length = (current.year - first.year) * 12 + current.month - first.month + 1
+    keep = index < length
+    return first, np.bincount(index[keep], weights=values[keep], minlength=max(length, 1))
+
+
+def theil_sen(values: np.ndarray, confidence: float = 0.9) -> Tuple[float, float, float]:
+    """Median pairwise slope of an evenly spaced series with Sen's confidence bounds"""
+    n = len(values)
+    i, j = np.triu_indices(n, k=1)
+    slopes = np.sort((values[j] - values[i]) / (j - i))
+    count = len(slopes)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    spread = z * math.sqrt(n * (n - 1) * (2 * n + 5) / 18)
+    low = int(max(0, math.floor((count - spread) / 2)))
+    high = int(min(count - 1, math.ceil((count + spread) / 2)))
+    return float(np.median(slopes)), float(slopes[low]), float(slopes[high])
+
+
+def _months_to(remaining: float, rate: float) -> Optional[int]:
+    if remaining <= 0:
+        return 0
+    if rate <= 0:
+        return None
+    months = math.ceil(remaining / rate)
+    return months if months <= MAX_FORECAST_MONTHS else None
+
+
+def estimate_savings(balance: float, monthly: list, target: float,
+                     today: Optional[date] = None, confidence: float = 0.9) -> Optional[dict]:
+    """Fit the trend of the monthly savings balance and project it to `target`.
+
+    The balance at the end of each month is rebuilt from the current balance
+    and the monthly net amounts. The current, unfinished month is left out of
+    the fit once there are at least two complete months. The Theil-Sen slope
+    of that balance is the monthly savings rate: lumpy months and money
+    parked in the jar for a short time barely move it, and it does not
+    depend on how often the user saves. Returns None when fewer than two
+    months of data are available.
+    """
+    today = today or date.today()
+    _, net = monthly_series(monthly, today)
+    fit = net[:-1] if len(net) > 2 else net
+    if len(fit) < 2:
+        return None
+
+    opening = balance - net.sum()
+    balances = opening + np.cumsum(fit)
+    rate, rate_low, rate_high = theil_sen(balances, confidence)
+
+    remaining = target - balance
+    expected = _months_to(remaining, rate)
+    soonest = _months_to(remaining, rate_high)
+    latest = _months_to(remaining, rate_low)
+    return {
+        "monthly_rate": rate,
+        "rate_low": rate_low,
+        "rate_high": rate_high,
+        "confidence": confidence,
+        "months_used": len(fit),
+        "remaining": remaining,
+        "months_to_target": expected,
+        "target_date": add_months(today, expected) if expected is not None else None,
+        "earliest_date": add_months(today, soonest) if soonest is not None else None,
+        "latest_date": add_months(today, latest) if latest is not None else None,
+    }
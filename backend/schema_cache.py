@@ -0,0 +1,128 @@
+"""In-memory copy of the database schema used by the SQL tools"""
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+# Tables created by new_accumulative_db_schema.sql
+SCHEMA_TABLES = (
+    "users",
+    "jar_categories",
+    "monthly_income_entries",
+    "user_jars",
+    "transactions",
+    "current_jar_balances",
+    "monthly_income_summary",
+    "jar_dashboard_data",
+)
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "3600"))
+
+
+class SchemaCache:
+    """Column definitions of the app tables, read once and kept in memory.
+
+    The whole schema is loaded with a single information_schema query at
+    startup and reloaded when it is older than `ttl`, when a table is not
+    found, or when `refresh()` is called.
+    """
+
+    def __init__(self, client_getter: Callable, tables=SCHEMA_TABLES, ttl: float = SCHEMA_CACHE_TTL):
+        self.client_getter = client_getter
+        self.tables = tuple(tables)
+        self.ttl = ttl
+        self._columns = {}
+        self._text = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        self.last_error = None
+
+    def refresh(self) -> dict:
+        """Reload every table's columns from information_schema"""
+        table_list = ", ".join(f"'{table}'" for table in self.tables)
+        query = f"""
+        SELECT
+            table_name,
+            column_name,
+            data_type,
+            is_nullable,
+            column_default
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name IN ({table_list})
+        ORDER BY table_name, ordinal_position
+        """
+        result = self.client_getter().rpc('run_sql', {'query': query}).execute()
+
+        columns = {}
+        for column in result.data or []:
+            columns.setdefault(column['table_name'], []).append(column)
+
+        with self._lock:
+            self._columns = columns
+            self._text = {table: self._format(table, cols) for table, cols in columns.items()}
+            self._loaded_at = time.monotonic()
+            self.refreshes += 1
+            self.last_error = None
+        print(f"Loaded schema for {len(columns)} tables")
+        return columns
+
+    def load(self):
+        """Startup load; a failure is recorded and retried on first use"""
+        try:
+            self.refresh()
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Schema load failed: {e}")
+
+    @staticmethod
+    def _format(table: str, columns: list) -> str:
+        formatted_schema = [f"{table.replace('_', ' ').title()} Table Schema ({table}):"]
+        formatted_schema.append("-" * 40)
+        for column in columns:
+            column_info = [
+                f"Column: {column['column_name']}",
+                f"Type: {column['data_type']}",
+                f"Nullable: {column['is_nullable']}",
+                f"Default: {column['column_default'] or 'None'}"
+            ]
+            formatted_schema.append("\n".join(column_info))
+            formatted_schema.append("-" * 40)
+        return "\n".join(formatted_schema)
+
+    def _stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def get(self, table: str = "transactions") -> Optional[str]:
+        """Formatted schema of `table`, or None if it does not exist.
+
+        If a reload fails, the copy already in memory is served and the
+        error kept in `last_error`; it only raises when there is no copy.
+        """
+        if self._stale() or (table in self.tables and table not in self._text):
+            try:
+                self.refresh()
+            except Exception as e:
+                if table not in self._text:
+                    raise
+                self.last_error = str(e)
+                print(f"Schema reload failed, serving cached copy: {e}")
+        return self._text.get(table)
+
+    def compact(self) -> str:
+        """One line per cached table for the system prompt; never hits the database"""
+        lines = []
+        for table in self.tables:
+            columns = self._columns.get(table)
+            if columns:
+                fields = ", ".join(f"{c['column_name']} {c['data_type']}" for c in columns)
+                lines.append(f"- {table}({fields})")
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        return {
+            "tables": len(self._columns),
+            "age_s": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+            "ttl": self.ttl,
+            "refreshes": self.refreshes,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,82 @@
+"""Cached, rate-limited web search for the search_web tool"""
+import asyncio
+import os
+
+from cache import TTLCache
+
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "900"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))
+# Searches sent to the provider at the same time, across all chats
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "4"))
+SEARCH_TIMEOUT_S = float(os.getenv("SEARCH_TIMEOUT_S", "20"))
+
+
+def normalize_query(query: str) -> str:
+    """Cache key of a query: case and spacing do not change the results"""
+    return " ".join(query.casefold().split())
+
+
+class WebSearch:
+    """Async front for a search backend with a TTL cache, request coalescing
+    and a concurrency limit.
+
+    `backend` is anything with an `ainvoke(query)` coroutine, such as
+    `TavilySearch` or a local stand-in. Identical queries that arrive while
+    one is in flight share its result instead of calling the provider
+    again, and a caller that gives up does not cancel the shared request.
+    Failed searches are not cached.
+    """
+
+    def __init__(self, backend, cache: TTLCache = None,
+                 concurrency: int = SEARCH_CONCURRENCY, timeout_s: float = SEARCH_TIMEOUT_S):
+        self.backend = backend
+        self.cache = cache if cache is not None else TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+        self.concurrency = concurrency
+        self.timeout_s = timeout_s
+        self._semaphore = None
+        self._in_flight = {}
+        self.backend_calls = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def search(self, query: str):
+        """Result for `query`, from the cache, a matching in-flight search or the backend"""
+        key = normalize_query(query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, query))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    async def _fetch(self, key: str, query: str):
+        if self._semaphore is None:
+            # Created on first use so it binds to the serving event loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            self.backend_calls += 1
+            result = await asyncio.wait_for(self.backend.ainvoke(query), timeout=self.timeout_s)
+        if not (isinstance(result, dict) and result.get("error")):
+            self.cache.set(key, result)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "backend_calls": self.backend_calls,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "in_flight": len(self._in_flight),
+            "concurrency": self.concurrency,
+            "cache": self.cache.stats(),
+        }
@@ -0,0 +1,285 @@
+"""Local validation of model-written SQL before it reaches Postgres"""
+import os
+import threading
+from collections import Counter
+
+import sqlglot
+from sqlglot import exp
+
+from schema_cache import SCHEMA_TABLES
+
+# Highest planner cost (EXPLAIN "Total Cost") a query may have
+SQL_COST_CEILING = float(os.getenv("SQL_COST_CEILING", "50000"))
+# Rows a single query may produce at most; pages are cut from this
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "10000"))
+
+# Column that scopes each table to one user; jar_categories is shared
+USER_COLUMNS = {
+    "users": "id",
+    "monthly_income_entries": "user_id",
+    "user_jars": "user_id",
+    "transactions": "user_id",
+    "current_jar_balances": "user_id",
+    "monthly_income_summary": "user_id",
+    "jar_dashboard_data": "user_id",
+}
+FORBIDDEN_FUNCTIONS = {"dblink", "lo_import", "lo_export", "set_config", "current_setting", "query_to_xml"}
+# Set-returning generators: their row count comes from the arguments, not from a table
+GENERATOR_FUNCTIONS = {"generate_series", "generate_subscripts"}
+# Marks a table that a FULL join keeps even where its ON clause is false
+FULL_JOIN = "full"
+
+
+class SqlRejected(Exception):
+    """Raised when a query must not be sent to the database"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _conjuncts(condition):
+    condition = condition.unnest()
+    if isinstance(condition, exp.And):
+        return _conjuncts(condition.left) + _conjuncts(condition.right)
+    return [condition]
+
+
+def _is_cte_reference(table) -> bool:
+    """Whether `table` names a CTE visible where it appears rather than a real table.
+
+    A CTE is visible in the query that defines it and, inside the WITH
+    list, only to the CTEs after it, unless the WITH is RECURSIVE. The body
+    of `WITH transactions AS (SELECT * FROM transactions)` therefore reads
+    the real table.
+    """
+    if table.db:
+        return False
+    name = table.name.lower()
+    node = table
+    while node.parent is not None:
+        parent = node.parent
+        if isinstance(parent, exp.With):
+            ctes = parent.expressions
+            index = next(i for i, cte in enumerate(ctes) if cte is node)
+            visible = ctes if parent.args.get("recursive") else ctes[:index]
+            if name in {cte.alias_or_name.lower() for cte in visible}:
+                return True
+        elif isinstance(parent, exp.Query):
+            with_ = parent.args.get("with") or parent.args.get("with_")
+            if with_ is not None and node is not with_ and name in {
+                cte.alias_or_name.lower() for cte in with_.expressions
+            }:
+                return True
+        node = parent
+    return False
+
+
+def _user_filter(conjunct, alias: str, column: str, single_table: bool):
+    """The literal a top-level `alias.column = <literal>` predicate compares with"""
+    if not isinstance(conjunct, exp.EQ):
+        return None
+    for col, value in ((conjunct.left, conjunct.right), (conjunct.right, conjunct.left)):
+        if (
+            isinstance(col, exp.Column)
+            and col.name.lower() == column
+            and (col.table.lower() == alias or (not col.table and single_table))
+            and isinstance(value, exp.Literal)
+        ):
+            return value.this
+    return None
+
+
+class SqlGuard:
+    """Parses a query and enforces the rules sql_executor relies on.
+
+    Only a single SELECT over the app tables is allowed. Every user-scoped
+    table must be filtered to the caller's user; a missing filter is added,
+    a filter for another user is rejected. Joins need a condition, the row
+    count is capped with LIMIT, and `check_cost` rejects plans above the
+    cost ceiling. Rejections are counted per reason for /metrics.
+    """
+
+    def __init__(self, cost_ceiling: float = SQL_COST_CEILING, max_rows: int = SQL_MAX_ROWS):
+        self.cost_ceiling = cost_ceiling
+        self.max_rows = max_rows
+        self.checked = 0
+        self.rewritten = 0
+        self.explain_failures = 0
+        self.rejections = Counter()
+        self._lock = threading.Lock()
+
+    def _reject(self, reason: str, message: str):
+        with self._lock:
+            self.rejections[reason] += 1
+        raise SqlRejected(reason, message)
+
+    def prepare(self, sql_query: str, user_id: int) -> str:
+        """Validate `sql_query` for `user_id` and return the SQL to run"""
+        with self._lock:
+            self.checked += 1
+        try:
+            statements = [s for s in sqlglot.parse(sql_query, read="postgres") if s is not None]
+        except sqlglot.errors.ParseError as e:
+            self._reject("parse_error", f"Could not parse query: {str(e).splitlines()[0]}")
+        if len(statements) != 1:
+            self._reject("multiple_statements", "Send exactly one SELECT statement")
+        tree = statements[0]
+        if not isinstance(tree, exp.Query) or tree.find(exp.DML, exp.DDL, exp.Command):
+            self._reject("not_select", "Only SELECT queries are allowed")
+
+        for func in tree.find_all(exp.Anonymous):
+            name = str(func.this).lower()
+            if name.startswith("pg_") or name in FORBIDDEN_FUNCTIONS | GENERATOR_FUNCTIONS:
+                self._reject("forbidden_function", f"Function {name} is not allowed")
+        # sqlglot parses generate_series into its own expression type
+        if tree.find(exp.GenerateSeries):
+            self._reject("forbidden_function", "Function generate_series is not allowed")
+
+        for table in tree.find_all(exp.Table):
+            name = table.name.lower()
+            if _is_cte_reference(table):
+                continue
+            if name not in SCHEMA_TABLES or table.db.lower() not in ("", "public"):
+                self._reject("table_not_allowed", f"Table {table.sql()} is not available")
+
+        rewritten = False
+        for select in list(tree.find_all(exp.Select)):
+            if self._scope_to_user(select, user_id):
+                rewritten = True
+
+        if isinstance(tree, exp.Select):
+            limit = tree.args.get("limit")
+            value = limit.expression if limit is not None else None
+            if not (isinstance(value, exp.Literal) and value.is_int and int(value.this) <= self.max_rows):
+                tree = tree.limit(self.max_rows, copy=False)
+                rewritten = True
+        else:
+            # UNION / INTERSECT / EXCEPT: cap the combined result
+            tree = exp.select("*").from_(tree.subquery("guarded_q")).limit(self.max_rows)
+            rewritten = True
+
+        if rewritten:
+            with self._lock:
+                self.rewritten += 1
+        return tree.sql(dialect="postgres")
+
+    def _scope_to_user(self, select, user_id: int) -> bool:
+        """Make sure each user-scoped table in this SELECT's FROM/JOINs is
+        filtered to `user_id`; returns True if a filter had to be added.
+
+        Inner-joined tables are filtered in WHERE. A table on the nullable
+        side of a LEFT or RIGHT join is filtered in that join's ON clause
+        instead, so rows without a match keep their NULLs rather than
+        disappearing. A FULL join keeps unmatched rows of both sides
+        whatever its ON clause says, so its tables are read through a
+        filtered subquery.
+        """
+        source = select.args.get("from") or select.args.get("from_")
+        if source is None:
+            return False
+        joins = select.args.get("joins") or []
+        for join in joins:
+            if (join.args.get("kind") or "").upper() == "CROSS" or not (join.args.get("on") or join.args.get("using")):
+                self._reject("cartesian_join", "Every JOIN needs an ON or USING condition")
+
+        # Where each source is scoped: None for WHERE, a join for its ON
+        # clause, FULL_JOIN for a subquery. A LEFT joined table uses its own
+        # join, the tables before a RIGHT join use that join.
+        sources = [(source.this, None)]
+        for join in joins:
+            side = (join.args.get("side") or "").upper()
+            if side == "RIGHT":
+                sources = [(table, outer or join) for table, outer in sources]
+            elif side == "FULL":
+                sources = [(table, outer or FULL_JOIN) for table, outer in sources]
+            sources.append((join.this, {"LEFT": join, "FULL": FULL_JOIN}.get(side)))
+        tables = [
+            (table, outer) for table, outer in sources
+            if isinstance(table, exp.Table) and table.name.lower() in USER_COLUMNS and not _is_cte_reference(table)
+        ]
+
+        where = select.args.get("where")
+        where_conjuncts = _conjuncts(where.this) if where is not None else []
+        added = False
+        for table, outer in tables:
+            alias = table.alias_or_name.lower()
+            column = USER_COLUMNS[table.name.lower()]
+            conjuncts = list(where_conjuncts)
+            if outer not in (None, FULL_JOIN) and outer.args.get("on") is not None:
+                conjuncts += _conjuncts(outer.args["on"])
+            values = {
+                value for value in (_user_filter(c, alias, column, len(tables) == 1) for c in conjuncts)
+                if value is not None
+            }
+            if values - {str(user_id)}:
+                self._reject("foreign_user", "Queries may only read the current user's data")
+            if values:
+                continue
+            condition = exp.EQ(this=exp.column(column, table=table.alias_or_name), expression=exp.Literal.number(user_id))
+            if outer is None:
+                select.where(condition, copy=False)
+            elif outer is not FULL_JOIN and outer.args.get("on") is not None:
+                outer.set("on", exp.and_(outer.args["on"], condition))
+            else:
+                # FULL joins, and USING which has no clause to extend
+                scoped = exp.select("*").from_(exp.table_(table.name, db=table.db or None)).where(
+                    exp.EQ(this=exp.column(column), expression=exp.Literal.number(user_id))
+                )
+                table.replace(scoped.subquery(table.alias_or_name))
+            added = True
+        return added
+
+    def is_ordered(self, sql_query: str) -> bool:
+        """Whether the query has a top-level ORDER BY.
+
+        Postgres returns rows of an unordered query in no fixed order, so
+        pages read with separate OFFSETs could repeat or skip rows.
+        """
+        try:
+            tree = sqlglot.parse_one(sql_query, read="postgres")
+        except sqlglot.errors.ParseError:
+            return False
+        return tree.args.get("order") is not None
+
+    def check_page(self, sql_query: str, offset: int):
+        """Reject reading past the first page of an unordered query"""
+        if offset > 0 and not self.is_ordered(sql_query):
+            self._reject(
+                "unordered_pagination",
+                "Pages after the first need a stable order: add an ORDER BY that ends with a unique "
+                "column such as id, and start again from offset 0",
+            )
+
+    def check_cost(self, sql_query: str, supabase) -> float:
+        """Reject the query if its estimated plan cost is over the ceiling.
+
+        Relies on the `explain_sql` RPC; if it is not installed the check is
+        skipped and counted, since the row and user rules above still hold.
+        """
+        try:
+            result = supabase.rpc('explain_sql', {'query': sql_query}).execute()
+            plan = result.data[0] if isinstance(result.data, list) else result.data
+            cost = float(plan["Plan"]["Total Cost"])
+        except Exception as e:
+            with self._lock:
+                self.explain_failures += 1
+            print(f"EXPLAIN unavailable, skipping cost check: {e}")
+            return 0.0
+        if cost > self.cost_ceiling:
+            self._reject(
+                "cost_ceiling",
+                f"Query is too expensive (estimated cost {cost:,.0f} > {self.cost_ceiling:,.0f}); "
+                "narrow the date range or filters",
+            )
+        return cost
+
+    def stats(self) -> dict:
+        return {
+            "checked": self.checked,
+            "rewritten": self.rewritten,
+            "rejected": sum(self.rejections.values()),
+            "rejections": dict(self.rejections),
+            "explain_failures": self.explain_failures,
+            "cost_ceiling": self.cost_ceiling,
+        }
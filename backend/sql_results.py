@@ -0,0 +1,79 @@
+"""Compact, bounded encoding of `run_sql` results for the model"""
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+# Rows fetched from Postgres per page; the database never sends more than
+# one extra row, which is only used to tell whether another page exists
+SQL_PAGE_SIZE = int(os.getenv("SQL_PAGE_SIZE", "200"))
+# Approximate tokens of row data handed to the model per tool call
+SQL_RESULT_TOKEN_BUDGET = int(os.getenv("SQL_RESULT_TOKEN_BUDGET", "3000"))
+
+
+def paginate_query(sql_query: str, offset: int, page_size: int = SQL_PAGE_SIZE) -> str:
+    """Wrap a SELECT so Postgres only returns one page (plus one row) starting at `offset`.
+
+    Pages only line up across calls when the query has an ORDER BY giving
+    every row a unique position; sql_executor refuses later pages otherwise.
+    """
+    return f"SELECT * FROM ({sql_query}) AS page_q LIMIT {page_size + 1} OFFSET {max(offset, 0)}"
+
+
+def _cell(val):
+    if isinstance(val, bool) or val is None or isinstance(val, (int, float, str)):
+        return val
+    if isinstance(val, Decimal):
+        return float(val)
+    if isinstance(val, (datetime, date)):
+        return val.isoformat()
+    return str(val)
+
+
+def _summarize(columns: list, rows: list) -> dict:
+    """Numeric column totals so truncated results still answer aggregate questions"""
+    summary = {}
+    for i, column in enumerate(columns):
+        values = [row[i] for row in rows
+                  if isinstance(row[i], (int, float)) and not isinstance(row[i], bool)]
+        if values:
+            summary[column] = {"sum": sum(values), "min": min(values), "max": max(values)}
+    return summary
+
+
+def encode_result(rows: list, offset: int = 0, page_size: int = SQL_PAGE_SIZE,
+                  token_budget: int = SQL_RESULT_TOKEN_BUDGET) -> dict:
+    """Turn a page of `run_sql` rows into a columnar result.
+
+    Column names are sent once and each row becomes a list. Rows past the
+    token budget are dropped and replaced by a summary of the page they
+    were fetched with; `next_offset` points at the first row not sent, so
+    the dropped rows come first in the next page of an ordered query.
+    """
+    more_pages = len(rows) > page_size
+    rows = rows[:page_size]
+    columns = list(rows[0].keys()) if rows else []
+    encoded = [[_cell(row.get(column)) for column in columns] for row in rows]
+
+    kept = len(encoded)
+    used = len(json.dumps(columns)) // 4
+    for i, row in enumerate(encoded):
+        used += len(json.dumps(row, ensure_ascii=False)) // 4 + 1
+        if used > token_budget:
+            # Always send one row so the next offset moves forward
+            kept = max(i, 1)
+            break
+
+    has_more = more_pages or kept < len(encoded)
+    result = {
+        "columns": columns,
+        "rows": encoded[:kept],
+        "offset": offset,
+        "row_count": len(encoded),
+        "has_more": has_more,
+        "next_offset": offset + kept if has_more else None,
+    }
+    if kept < len(encoded):
+        result["truncated"] = True
+        result["summary"] = _summarize(columns, encoded)
+    return result
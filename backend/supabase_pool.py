@@ -0,0 +1,125 @@
+"""Process-wide Supabase client with a pooled, keep-alive HTTP session"""
+import os
+import threading
+import time
+from datetime import datetime
+
+import httpx
+from supabase import create_client
+
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "60"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+SUPABASE_HEALTH_INTERVAL = float(os.getenv("SUPABASE_HEALTH_INTERVAL", "30"))
+
+
+class SupabaseClientManager:
+    """Owns a single Supabase client shared by every tool and request.
+
+    The client's PostgREST calls go through one httpx connection pool, so
+    consecutive queries in a chat turn reuse warm TLS connections instead of
+    reconnecting for every tool call. supabase-py 2.3 has no option for
+    passing in an HTTP client, so the pool replaces the session of its
+    PostgREST client, keeping that session's URL, headers and timeout.
+    """
+
+    def __init__(self, url: str, key: str, pool_size: int = SUPABASE_POOL_SIZE,
+                 keepalive_expiry: float = SUPABASE_KEEPALIVE_EXPIRY,
+                 timeout: float = SUPABASE_TIMEOUT):
+        self.url = url
+        self.key = key
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self._client = None
+        self._http = None
+        self._lock = threading.Lock()
+        self.last_health = {"status": "unknown"}
+
+    def start(self):
+        """Create the shared client if it does not exist yet"""
+        with self._lock:
+            if self._client is not None:
+                return self._client
+
+            if not self.url or not self.key:
+                raise Exception("Supabase URL and key must be configured")
+
+            client = create_client(self.url, self.key)
+            self._pool_postgrest(client)
+            self._client = client
+            print(f"Supabase client started (pool size: {self.pool_size})")
+            return self._client
+
+    def _pool_postgrest(self, client):
+        """Give the client's PostgREST calls a session with this manager's pool limits"""
+        postgrest = client.postgrest
+        current = postgrest.session
+        if current is self._http:
+            return
+        pooled = type(current)(
+            base_url=current.base_url,
+            headers=current.headers,
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+        )
+        current.close()
+        previous, self._http = self._http, pooled
+        postgrest.session = pooled
+        if previous is not None:
+            previous.close()
+
+    @property
+    def client(self):
+        client = self._client if self._client is not None else self.start()
+        if client.postgrest.session is not self._http:
+            # supabase-py rebuilds its PostgREST client after auth events
+            with self._lock:
+                self._pool_postgrest(client)
+        return client
+
+    def health_check(self) -> dict:
+        """Run a trivial query through the pool and record the result"""
+        start = time.perf_counter()
+        try:
+            self.client.table('jar_categories').select('id').limit(1).execute()
+            self.last_health = {
+                "status": "healthy",
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+                "checked_at": datetime.now().isoformat(),
+            }
+        except Exception as e:
+            self.last_health = {
+                "status": "unhealthy",
+                "error": str(e),
+                "checked_at": datetime.now().isoformat(),
+            }
+        return self.last_health
+
+    def close(self):
+        """Close pooled connections; the next use starts a fresh client"""
+        with self._lock:
+            if self._http is not None:
+                self._http.close()
+            self._http = None
+            self._client = None
+            print("Supabase client closed")
+
+    def stats(self) -> dict:
+        return {
+            "started": self._client is not None,
+            "pooled": self._http is not None,
+            "pool_size": self.pool_size,
+            "keepalive_expiry": self.keepalive_expiry,
+            "health": self.last_health,
+        }
+
+
+supabase_manager = SupabaseClientManager(
+    os.getenv("NEXT_PUBLIC_SUPABASE_URL"),
+    os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY"),
+)
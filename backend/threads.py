@@ -0,0 +1,95 @@
+"""Stable conversation thread identity and per-thread locking"""
+import asyncio
+import hashlib
+import os
+import uuid
+import weakref
+from contextlib import asynccontextmanager
+
+# Lifetime of a thread's cross-process lease; renewed while the request runs,
+# so it only matters when a worker dies holding one
+THREAD_LEASE_TTL = float(os.getenv("THREAD_LEASE_TTL", "30"))
+
+
+def thread_id_for(user_email: str) -> str:
+    """Derive the conversation thread ID for a user.
+
+    Uses a SHA-256 digest of the email instead of Python's per-process
+    randomized `hash`, so every worker process maps a user to the same
+    thread. The email is hashed exactly as given, since the users lookup
+    matches it exactly: accounts differing only in case never share a
+    thread.
+    """
+    return f"user_{hashlib.sha256(user_email.encode('utf-8')).hexdigest()[:32]}"
+
+
+class ThreadLocks:
+    """One asyncio.Lock per thread ID, created on demand.
+
+    Requests on the same thread run one after another so they never race
+    each other's checkpoints. Locks are held weakly and disappear once no
+    request is using them. With `leases` (the SQLite checkpointer) the
+    holder also takes the thread's lease in the shared database, so
+    requests in other worker processes wait too; the lease is renewed
+    while held and expires if its process dies.
+    """
+
+    def __init__(self, leases=None, lease_ttl: float = THREAD_LEASE_TTL):
+        self._locks = weakref.WeakValueDictionary()
+        self.leases = leases
+        self.lease_ttl = lease_ttl
+        self.waits = 0
+        self.lease_waits = 0
+        self.lost_leases = 0
+
+    def _get(self, thread_id: str) -> asyncio.Lock:
+        lock = self._locks.get(thread_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[thread_id] = lock
+        return lock
+
+    async def _acquire_lease(self, thread_id: str, owner: str):
+        delay = 0.02
+        waited = False
+        while not await asyncio.to_thread(self.leases.acquire_lease, thread_id, owner, self.lease_ttl):
+            if not waited:
+                self.lease_waits += 1
+                waited = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def _renew_lease(self, thread_id: str, owner: str):
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            if not await asyncio.to_thread(self.leases.acquire_lease, thread_id, owner, self.lease_ttl):
+                self.lost_leases += 1
+                print(f"Lost the lease on thread {thread_id}")
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str):
+        lock = self._get(thread_id)
+        if lock.locked():
+            self.waits += 1
+        async with lock:
+            if self.leases is None:
+                yield
+                return
+            owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+            await self._acquire_lease(thread_id, owner)
+            renewal = asyncio.create_task(self._renew_lease(thread_id, owner))
+            try:
+                yield
+            finally:
+                renewal.cancel()
+                # Released inline so a cancelled request cannot skip it
+                self.leases.release_lease(thread_id, owner)
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._locks),
+            "contended_waits": self.waits,
+            "cross_process": self.leases is not None,
+            "lease_waits": self.lease_waits,
+            "lost_leases": self.lost_leases,
+        }
@@ -0,0 +1,90 @@
+"""Tool execution node of the chat graph"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.prebuilt import ToolNode
+
+# Tool calls of one assistant step that may run at the same time
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "4"))
+
+
+# Error handler
+def handle_tool_error(state) -> dict:
+    error = state.get("error")
+    tool_calls = state["messages"][-1].tool_calls
+    error_msg = str(error) if error else "Unknown error occurred"
+
+    return {
+        "messages": [
+            ToolMessage(
+                content=error_msg,
+                tool_call_id=tc["id"],
+            )
+            for tc in tool_calls
+        ]
+    }
+
+# Tool node with fallback
+def create_tool_node_with_fallback(tools: list) -> dict:
+    return ToolNode(tools).with_fallbacks(
+        [RunnableLambda(handle_tool_error)], exception_key="error"
+    )
+
+
+class ParallelToolNode:
+    """Runs every tool call of an assistant step concurrently, each through
+    its own fallback-wrapped ToolNode.
+
+    A failing call gets its own error ToolMessage from `handle_tool_error`
+    while the other calls keep their results; with a single ToolNode for
+    the whole step one exception replaced every result with the error. At
+    most `concurrency` calls run at once; results keep the order of the
+    tool calls.
+    """
+
+    def __init__(self, tools: list, concurrency: int = TOOL_CONCURRENCY):
+        self.node = create_tool_node_with_fallback(tools)
+        self.concurrency = max(1, concurrency)
+
+    @staticmethod
+    def _for_call(state: dict, tool_call: dict) -> dict:
+        """`state` as if the assistant had asked for `tool_call` alone"""
+        messages = state["messages"]
+        request = messages[-1].model_copy(update={"tool_calls": [tool_call]})
+        return {**state, "messages": messages[:-1] + [request]}
+
+    @staticmethod
+    def _merge(outputs: list):
+        """One node update from the per-call outputs (dicts, Commands or lists of both)"""
+        updates = []
+        for output in outputs:
+            updates.extend(output if isinstance(output, list) else [output])
+        if all(isinstance(update, dict) for update in updates):
+            return {"messages": [message for update in updates for message in update["messages"]]}
+        return updates
+
+    def invoke(self, state: dict, config=None):
+        tool_calls = state["messages"][-1].tool_calls
+        if len(tool_calls) <= 1:
+            return self.node.invoke(state, config)
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(tool_calls))) as pool:
+            outputs = list(pool.map(lambda call: self.node.invoke(self._for_call(state, call), config), tool_calls))
+        return self._merge(outputs)
+
+    async def ainvoke(self, state: dict, config=None):
+        tool_calls = state["messages"][-1].tool_calls
+        if len(tool_calls) <= 1:
+            return await self.node.ainvoke(state, config)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(call):
+            async with semaphore:
+                return await self.node.ainvoke(self._for_call(state, call), config)
+
+        return self._merge(await asyncio.gather(*[run(call) for call in tool_calls]))
+
+    def as_runnable(self) -> RunnableLambda:
+        return RunnableLambda(self.invoke, afunc=self.ainvoke, name="tools")
@@ -31,9 +31,10 @@ interface ChatInterfaceProps {
 }
 
 interface SSEData {
-  type: 'thinking' | 'final' | 'error' | 'done';
+  type: 'thinking' | 'delta' | 'final' | 'error' | 'done';
   content?: string;
   step?: number;
+  message_id?: string;
 }
 
 interface RequestBody {
@@ -227,10 +228,9 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ isOpen, onClose }) => {
       // Prepare request body
       const requestBody: RequestBody = {
         message: inputMessage || 'Analyze this image',
-        conversation_history: messages.map(msg => ({
-          role: msg.role,
-          content: msg.content
-        })),
+        // The backend keeps the conversation in its checkpointer, so only
+        // the new message is sent
+        conversation_history: [],
         user_email: userEmail,
         new_thread: needNewThread
       };
@@ -277,6 +277,8 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ isOpen, onClose }) => {
       const reader = response.body.getReader();
       const decoder = new TextDecoder();
       let finalResponse = '';
+      // Id of the assistant message being filled by delta events, if any
+      let streamingMessageId: number | null = null;
 
       while (true) {
         const { value, done } = await reader.read();
@@ -290,7 +292,34 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ isOpen, onClose }) => {
             try {
               const data: SSEData = JSON.parse(line.slice(6));
               
-              if (data.type === 'thinking') {
+              if (data.type === 'delta') {
+                // Show answer tokens as they arrive; 'final' replaces them
+                const delta = data.content || '';
+                setCurrentThinking(null);
+                if (streamingMessageId === null) {
+                  const messageId = Date.now() + 1;
+                  streamingMessageId = messageId;
+                  setMessages(prev => [...prev, {
+                    id: messageId,
+                    role: 'assistant',
+                    content: delta,
+                    timestamp: new Date()
+                  }]);
+                } else {
+                  const messageId = streamingMessageId;
+                  setMessages(prev => prev.map(msg =>
+                    msg.id === messageId ? { ...msg, content: msg.content + delta } : msg
+                  ));
+                }
+
+              } else if (data.type === 'thinking') {
+                // Text streamed before a tool call was not the answer
+                if (streamingMessageId !== null) {
+                  const messageId = streamingMessageId;
+                  streamingMessageId = null;
+                  setMessages(prev => prev.filter(msg => msg.id !== messageId));
+                }
+
                 // Update current thinking step
                 setCurrentThinking({
                   content: data.content || '',
@@ -340,13 +369,21 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ isOpen, onClose }) => {
                 finalResponse = responseContent;
                 setCurrentThinking(null);
                 
-                const assistantMessage: Message = {
-                  id: Date.now() + 1,
-                  role: 'assistant',
-                  content: finalResponse,
-                  timestamp: new Date()
-                };
-                setMessages(prev => [...prev, assistantMessage]);
+                if (streamingMessageId !== null) {
+                  const messageId = streamingMessageId;
+                  streamingMessageId = null;
+                  setMessages(prev => prev.map(msg =>
+                    msg.id === messageId ? { ...msg, content: finalResponse } : msg
+                  ));
+                } else {
+                  const assistantMessage: Message = {
+                    id: Date.now() + 1,
+                    role: 'assistant',
+                    content: finalResponse,
+                    timestamp: new Date()
+                  };
+                  setMessages(prev => [...prev, assistantMessage]);
+                }
                 
               } else if (data.type === 'error') {
                 throw new Error(data.content || 'Unknown error');
@@ -3,6 +3,8 @@
 import json
 import os
 import sys
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
@@ -29,6 +31,18 @@ tables_to_clear = [
     "jar_categories"
 ]
 
+# Seconds spent in each import step, printed at the end
+timings = {}
+
+@contextmanager
+def timed(step):
+    """Add the time spent in the block to timings[step]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[step] = timings.get(step, 0.0) + time.perf_counter() - start
+
 def ensure_jar_categories_exist(jar_categories):
     """Ensure jar categories exist in the database"""
     print("Ensuring jar categories exist...")
@@ -124,19 +138,30 @@ def insert_transactions(transactions):
         print(f"Inserting batch {i//batch_size + 1}/{(total_transactions-1)//batch_size + 1} ({len(batch)} transactions)")
         supabase.table("transactions").insert(batch).execute()
 
-def refresh_dashboard_data():
-    """Refresh Supabase RPC data"""
+def begin_bulk_load(user_ids):
+    """Suspend the dashboard refresh triggers for these users until end_bulk_load"""
+    print("Starting bulk load (dashboard triggers suspended)...")
+    supabase.rpc("begin_bulk_load", {"p_user_ids": user_ids}).execute()
+
+def end_bulk_load(user_ids):
+    """Resume the triggers and rebuild the users' dashboard rows once"""
+    print("Finishing bulk load (one dashboard rebuild)...")
+    supabase.rpc("end_bulk_load", {"p_user_ids": user_ids}).execute()
+    print("Dashboard data refreshed successfully")
+
+def refresh_dashboard_data(user_ids):
+    """Rebuild the dashboard tables for the imported users only"""
     print("Refreshing dashboard data...")
     
     try:
-        # Call the RPC functions to refresh the data
-        supabase.rpc("refresh_jar_dashboard_data").execute()
+        # Same scoped path the incremental triggers use, limited to these users
+        supabase.rpc("refresh_jar_dashboard_for_users", {"p_user_ids": user_ids}).execute()
         print("Dashboard data refreshed successfully")
     except Exception as e:
         print(f"Warning: Could not refresh dashboard data: {e}")
         print("Continuing with import process...")
         print("Note: You may need to manually refresh the dashboard data or create the necessary functions.")
-        print("Check the database schema to ensure the refresh_jar_dashboard_data function exists.")
+        print("Check the database schema to ensure the refresh_jar_dashboard_for_users function exists.")
         print("This is not critical for the import process and can be addressed later.")
         
 
@@ -169,8 +194,20 @@ def generate_statistics(data):
     for category, amount in spending_by_category.items():
         print(f"  {category}: {amount/100:,.2f} VND ({amount/100/total_spending*100:.1f}%)")
 
-def run_import(data_file):
-    """Run the import process"""
+def print_timings():
+    """Show where the import spent its time"""
+    print("\n=== Import Timings ===")
+    for step, seconds in timings.items():
+        print(f"  {step}: {seconds:.2f}s")
+    print(f"  total: {sum(timings.values()):.2f}s")
+
+def run_import(data_file, bulk_load=True):
+    """Run the import process.
+
+    With `bulk_load` the refresh triggers skip this user's rows while the
+    data is written and the dashboard is rebuilt once at the end; without
+    it every batch updates the dashboard as it is inserted.
+    """
     print(f"Reading data from {data_file}...")
     
     with open(data_file, "r") as f:
@@ -178,30 +215,51 @@ def run_import(data_file):
     
     print(f"Loaded data with {len(data['transactions'])} transactions (income entries will be skipped)")
     
+    user_ids = [data["user"]["id"]]
+    
     # Clear existing data first
-    clear_existing_data()
+    with timed("clear existing data"):
+        clear_existing_data()
     
     # Create jar categories first
-    ensure_jar_categories_exist(data["jar_categories"])
+    with timed("jar categories"):
+        ensure_jar_categories_exist(data["jar_categories"])
     
     # Then create the user
-    ensure_user_exists(data["user"])
-    
-    # Initialize user jars after user exists
-    initialize_user_jars(data["user_jars"])
+    with timed("user"):
+        ensure_user_exists(data["user"])
     
-    # Skip monthly income entries
-    # insert_monthly_income_entries(data["monthly_income_entries"])
+    if bulk_load:
+        with timed("begin bulk load"):
+            begin_bulk_load(user_ids)
     
-    # Insert transactions
-    insert_transactions(data["transactions"])
+    try:
+        # Initialize user jars after user exists
+        with timed("user jars"):
+            initialize_user_jars(data["user_jars"])
+        
+        # Skip monthly income entries
+        # insert_monthly_income_entries(data["monthly_income_entries"])
+        
+        # Insert transactions
+        with timed("transactions"):
+            insert_transactions(data["transactions"])
+    finally:
+        # Always close the session, or the user's dashboard stays frozen
+        if bulk_load:
+            with timed("end bulk load (dashboard rebuild)"):
+                end_bulk_load(user_ids)
     
-    # Refresh dashboard data
-    refresh_dashboard_data()
+    if not bulk_load:
+        # Refresh dashboard data
+        with timed("dashboard refresh"):
+            refresh_dashboard_data(user_ids)
     
     # Generate statistics
     generate_statistics(data)
     
+    print_timings()
+    
     print("\nImport completed successfully!")
 
 def main():
@@ -213,7 +271,8 @@ def main():
         print("Please run generate_fake_data.py first to create the data file.")
         sys.exit(1)
     
-    run_import(data_file)
+    # --no-bulk-load keeps the per-batch trigger refreshes, for comparing timings
+    run_import(data_file, bulk_load="--no-bulk-load" not in sys.argv[1:])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
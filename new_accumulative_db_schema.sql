@@ -26,6 +26,7 @@ CREATE TABLE public.monthly_income_entries (
   month_year date NOT NULL, -- e.g., '2024-01-01' for January 2024
   total_income_cents bigint NOT NULL,
   allocation_percentages jsonb NOT NULL, -- {"Necessity": 55, "Play": 10, ...}
+  idempotency_key text, -- Set by allocate_monthly_income to recognise repeated submissions
   created_at timestamp without time zone NOT NULL DEFAULT now(),
   CONSTRAINT monthly_income_entries_pkey PRIMARY KEY (id),
   CONSTRAINT monthly_income_entries_user_id_fkey FOREIGN KEY (user_id) REFERENCES public.users(id),
@@ -115,6 +116,14 @@ CREATE TABLE public.jar_dashboard_data (
   CONSTRAINT jar_dashboard_data_user_category_unique UNIQUE (user_id, category_id)
 );
 
+-- TABLE: Bulk Load Sessions - Users whose derived rows are rebuilt once at the end of an import
+CREATE TABLE public.bulk_load_sessions (
+  user_id integer NOT NULL,
+  started_at timestamp without time zone NOT NULL DEFAULT now(),
+  CONSTRAINT bulk_load_sessions_pkey PRIMARY KEY (user_id),
+  CONSTRAINT bulk_load_sessions_user_id_fkey FOREIGN KEY (user_id) REFERENCES public.users(id) ON DELETE CASCADE
+);
+
 -- FUNCTION: Refresh current jar balances
 CREATE OR REPLACE FUNCTION refresh_current_jar_balances()
 RETURNS void AS $$
@@ -219,50 +228,496 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
--- TRIGGER FUNCTION: Update tables when transactions change
+-- The functions above rebuild every user's rows; use them for the initial population
+-- and for repairs. Day-to-day writes go through the scoped functions below, whose cost
+-- depends only on the rows a statement touches, not on the size of the tables.
+-- "This month" columns of untouched jars are brought up to date at the next write to
+-- that jar; schedule SELECT refresh_jar_dashboard_data() monthly if exact roll-over matters.
+
+-- FUNCTION: Rebuild jar_dashboard_data for the given (user, category) pairs
+CREATE OR REPLACE FUNCTION refresh_jar_dashboard_pairs(p_user_ids integer[], p_category_ids integer[])
+RETURNS void AS $$
+BEGIN
+  -- Upserts rather than delete + insert, so concurrent writes to the same jar
+  -- never collide on the unique key. "user_id = ANY" keeps every statement on
+  -- the (user_id, category_id) indexes.
+  INSERT INTO public.jar_dashboard_data (
+    user_id, category_id, category_name, category_description,
+    total_income_cents, total_spent_cents, current_balance_cents,
+    latest_allocation_percentage, allocated_amount_this_month,
+    income_this_month, spent_this_month, last_updated
+  )
+  SELECT
+    cjb.user_id,
+    cjb.category_id,
+    cjb.category_name,
+    cjb.category_description,
+    cjb.total_income_cents,
+    cjb.total_spent_cents,
+    cjb.current_balance_cents,
+    COALESCE(latest_alloc.allocation_percentage, 0) as latest_allocation_percentage,
+    COALESCE(latest_alloc.allocated_amount_this_month, 0) as allocated_amount_this_month,
+    COALESCE(current_month.income_this_month, 0) as income_this_month,
+    COALESCE(current_month.spent_this_month, 0) as spent_this_month,
+    now() as last_updated
+  FROM (SELECT DISTINCT user_id, category_id FROM unnest(p_user_ids, p_category_ids) AS k(user_id, category_id)) k
+  JOIN public.current_jar_balances cjb
+    ON cjb.user_id = ANY(p_user_ids) AND cjb.user_id = k.user_id AND cjb.category_id = k.category_id
+  LEFT JOIN LATERAL (
+    -- Latest allocation percentage for this user-category
+    SELECT
+      (mis.allocation_percentages->mis.category_name)::numeric as allocation_percentage,
+      mis.allocated_amount_cents as allocated_amount_this_month
+    FROM public.monthly_income_summary mis
+    WHERE mis.user_id = k.user_id AND mis.category_id = k.category_id
+    ORDER BY mis.month_year DESC
+    LIMIT 1
+  ) latest_alloc ON true
+  LEFT JOIN LATERAL (
+    -- Current month's income and spending for this jar (range scan on idx_transactions_user_jar_date)
+    SELECT
+      SUM(CASE WHEN t.amount_cents > 0 THEN t.amount_cents ELSE 0 END) as income_this_month,
+      SUM(CASE WHEN t.amount_cents < 0 THEN ABS(t.amount_cents) ELSE 0 END) as spent_this_month
+    FROM public.transactions t
+    WHERE t.user_id = k.user_id AND t.jar_category_id = k.category_id
+      AND t.occurred_at >= date_trunc('month', LOCALTIMESTAMP)
+      AND t.occurred_at < date_trunc('month', LOCALTIMESTAMP) + interval '1 month'
+  ) current_month ON true
+  ON CONFLICT (user_id, category_id) DO UPDATE SET
+    category_name = EXCLUDED.category_name,
+    category_description = EXCLUDED.category_description,
+    total_income_cents = EXCLUDED.total_income_cents,
+    total_spent_cents = EXCLUDED.total_spent_cents,
+    current_balance_cents = EXCLUDED.current_balance_cents,
+    latest_allocation_percentage = EXCLUDED.latest_allocation_percentage,
+    allocated_amount_this_month = EXCLUDED.allocated_amount_this_month,
+    income_this_month = EXCLUDED.income_this_month,
+    spent_this_month = EXCLUDED.spent_this_month,
+    last_updated = EXCLUDED.last_updated;
+
+  -- Jars that no longer have a balance row lose their dashboard row too
+  DELETE FROM public.jar_dashboard_data d
+  USING unnest(p_user_ids, p_category_ids) AS k(user_id, category_id)
+  WHERE d.user_id = ANY(p_user_ids) AND d.user_id = k.user_id AND d.category_id = k.category_id
+    AND NOT EXISTS (
+      SELECT 1 FROM public.current_jar_balances cjb
+      WHERE cjb.user_id = d.user_id AND cjb.category_id = d.category_id
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- FUNCTION: Recompute current_jar_balances (and the dashboard) for the given (user, category) pairs
+CREATE OR REPLACE FUNCTION rebuild_jar_balances(p_user_ids integer[], p_category_ids integer[])
+RETURNS void AS $$
+BEGIN
+  INSERT INTO public.current_jar_balances (
+    user_id, category_id, category_name, category_description,
+    total_income_cents, total_spent_cents, current_balance_cents, last_updated
+  )
+  SELECT
+    uj.user_id,
+    uj.category_id,
+    jc.name as category_name,
+    jc.description as category_description,
+    COALESCE(totals.total_income_cents, 0) as total_income_cents,
+    COALESCE(totals.total_spent_cents, 0) as total_spent_cents,
+    COALESCE(totals.current_balance_cents, 0) as current_balance_cents,
+    now() as last_updated
+  FROM (SELECT DISTINCT user_id, category_id FROM unnest(p_user_ids, p_category_ids) AS k(user_id, category_id)) k
+  JOIN public.user_jars uj
+    ON uj.user_id = ANY(p_user_ids) AND uj.user_id = k.user_id AND uj.category_id = k.category_id
+  JOIN public.jar_categories jc ON uj.category_id = jc.id
+  LEFT JOIN LATERAL (
+    -- One index range per jar, never a scan of the whole table
+    SELECT
+      SUM(CASE WHEN t.amount_cents > 0 THEN t.amount_cents ELSE 0 END) as total_income_cents,
+      SUM(CASE WHEN t.amount_cents < 0 THEN ABS(t.amount_cents) ELSE 0 END) as total_spent_cents,
+      SUM(t.amount_cents) as current_balance_cents
+    FROM public.transactions t
+    WHERE t.user_id = uj.user_id AND t.jar_category_id = uj.category_id
+  ) totals ON true
+  ON CONFLICT (user_id, category_id) DO UPDATE SET
+    category_name = EXCLUDED.category_name,
+    category_description = EXCLUDED.category_description,
+    total_income_cents = EXCLUDED.total_income_cents,
+    total_spent_cents = EXCLUDED.total_spent_cents,
+    current_balance_cents = EXCLUDED.current_balance_cents,
+    last_updated = EXCLUDED.last_updated;
+
+  -- Jars that were removed lose their balance row
+  DELETE FROM public.current_jar_balances cjb
+  USING unnest(p_user_ids, p_category_ids) AS k(user_id, category_id)
+  WHERE cjb.user_id = ANY(p_user_ids) AND cjb.user_id = k.user_id AND cjb.category_id = k.category_id
+    AND NOT EXISTS (
+      SELECT 1 FROM public.user_jars uj
+      WHERE uj.user_id = cjb.user_id AND uj.category_id = cjb.category_id
+    );
+
+  PERFORM refresh_jar_dashboard_pairs(p_user_ids, p_category_ids);
+END;
+$$ LANGUAGE plpgsql;
+
+-- FUNCTION: Add per-row transaction changes to current_jar_balances and refresh the affected dashboard rows
+-- p_signs is 1 for new rows and -1 for removed rows
+CREATE OR REPLACE FUNCTION apply_transaction_changes(
+  p_user_ids integer[], p_category_ids integer[], p_amounts bigint[], p_signs integer[]
+)
+RETURNS void AS $$
+DECLARE
+  v_user_ids integer[];
+  v_category_ids integer[];
+BEGIN
+  WITH deltas AS (
+    SELECT
+      c.user_id,
+      c.category_id,
+      SUM(c.sign * CASE WHEN c.amount_cents > 0 THEN c.amount_cents ELSE 0 END) as income_cents,
+      SUM(c.sign * CASE WHEN c.amount_cents < 0 THEN ABS(c.amount_cents) ELSE 0 END) as spent_cents
+    FROM unnest(p_user_ids, p_category_ids, p_amounts, p_signs) AS c(user_id, category_id, amount_cents, sign)
+    WHERE c.user_id IS NOT NULL
+    GROUP BY c.user_id, c.category_id
+  ), updated AS (
+    UPDATE public.current_jar_balances cjb
+    SET total_income_cents = cjb.total_income_cents + d.income_cents,
+        total_spent_cents = cjb.total_spent_cents + d.spent_cents,
+        current_balance_cents = cjb.current_balance_cents + d.income_cents - d.spent_cents,
+        last_updated = now()
+    FROM deltas d
+    WHERE cjb.user_id = ANY(p_user_ids) AND cjb.user_id = d.user_id AND cjb.category_id = d.category_id
+    RETURNING cjb.user_id, cjb.category_id
+  )
+  SELECT array_agg(user_id), array_agg(category_id) INTO v_user_ids, v_category_ids FROM updated;
+
+  IF v_user_ids IS NOT NULL THEN
+    PERFORM refresh_jar_dashboard_pairs(v_user_ids, v_category_ids);
+  END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- FUNCTION: Rebuild monthly_income_summary for the given (user, month) pairs, or all months of p_user_ids
+-- when p_months is NULL, then refresh those users' dashboard rows
+CREATE OR REPLACE FUNCTION rebuild_monthly_income_summary(p_user_ids integer[], p_months date[] DEFAULT NULL)
+RETURNS void AS $$
+DECLARE
+  v_user_ids integer[];
+  v_category_ids integer[];
+BEGIN
+  INSERT INTO public.monthly_income_summary (
+    user_id, month_year, total_income_cents, allocation_percentages,
+    category_id, category_name, allocated_amount_cents
+  )
+  SELECT
+    mie.user_id,
+    mie.month_year,
+    mie.total_income_cents,
+    mie.allocation_percentages,
+    jc.id as category_id,
+    jc.name as category_name,
+    ROUND((mie.total_income_cents * (mie.allocation_percentages->jc.name)::numeric / 100)) as allocated_amount_cents
+  FROM public.monthly_income_entries mie
+  CROSS JOIN public.jar_categories jc
+  WHERE (mie.allocation_percentages->jc.name) IS NOT NULL
+    AND mie.user_id = ANY(p_user_ids)
+    AND (p_months IS NULL OR (mie.user_id, mie.month_year) IN (
+      SELECT k.user_id, k.month_year FROM unnest(p_user_ids, p_months) AS k(user_id, month_year)
+    ))
+  ON CONFLICT (user_id, month_year, category_id) DO UPDATE SET
+    total_income_cents = EXCLUDED.total_income_cents,
+    allocation_percentages = EXCLUDED.allocation_percentages,
+    category_name = EXCLUDED.category_name,
+    allocated_amount_cents = EXCLUDED.allocated_amount_cents;
+
+  -- Summary rows whose entry (or allocation) is gone
+  DELETE FROM public.monthly_income_summary mis
+  WHERE mis.user_id = ANY(p_user_ids)
+    AND (p_months IS NULL OR (mis.user_id, mis.month_year) IN (
+      SELECT k.user_id, k.month_year FROM unnest(p_user_ids, p_months) AS k(user_id, month_year)
+    ))
+    AND NOT EXISTS (
+      SELECT 1 FROM public.monthly_income_entries mie
+      WHERE mie.user_id = mis.user_id AND mie.month_year = mis.month_year
+        AND (mie.allocation_percentages->mis.category_name) IS NOT NULL
+    );
+
+  SELECT array_agg(user_id), array_agg(category_id) INTO v_user_ids, v_category_ids
+  FROM public.current_jar_balances WHERE user_id = ANY(p_user_ids);
+  IF v_user_ids IS NOT NULL THEN
+    PERFORM refresh_jar_dashboard_pairs(v_user_ids, v_category_ids);
+  END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- FUNCTION: Rebuild every derived row of the given users (used by the data importer)
+CREATE OR REPLACE FUNCTION refresh_jar_dashboard_for_users(p_user_ids integer[])
+RETURNS void AS $$
+DECLARE
+  v_user_ids integer[];
+  v_category_ids integer[];
+BEGIN
+  SELECT array_agg(user_id), array_agg(category_id) INTO v_user_ids, v_category_ids
+  FROM (
+    SELECT user_id, category_id FROM public.user_jars WHERE user_id = ANY(p_user_ids)
+    UNION
+    SELECT user_id, category_id FROM public.current_jar_balances WHERE user_id = ANY(p_user_ids)
+  ) pairs;
+  IF v_user_ids IS NOT NULL THEN
+    PERFORM rebuild_jar_balances(v_user_ids, v_category_ids);
+  END IF;
+  PERFORM rebuild_monthly_income_summary(p_user_ids);
+END;
+$$ LANGUAGE plpgsql;
+
+-- FUNCTION: Start a bulk load; the refresh triggers skip rows of these users until end_bulk_load
+CREATE OR REPLACE FUNCTION begin_bulk_load(p_user_ids integer[])
+RETURNS void AS $$
+BEGIN
+  INSERT INTO public.bulk_load_sessions (user_id)
+  SELECT DISTINCT unnest(p_user_ids)
+  ON CONFLICT (user_id) DO UPDATE SET started_at = now();
+END;
+$$ LANGUAGE plpgsql;
+
+-- FUNCTION: Finish a bulk load with one rebuild of the users' derived rows
+-- If an import dies half way, calling this for its users repairs their dashboard.
+CREATE OR REPLACE FUNCTION end_bulk_load(p_user_ids integer[])
+RETURNS void AS $$
+BEGIN
+  DELETE FROM public.bulk_load_sessions WHERE user_id = ANY(p_user_ids);
+  PERFORM refresh_jar_dashboard_for_users(p_user_ids);
+END;
+$$ LANGUAGE plpgsql;
+
+-- TRIGGER FUNCTION: Apply transaction changes using the statement's transition tables
 CREATE OR REPLACE FUNCTION trigger_refresh_jar_data()
 RETURNS trigger AS $$
+DECLARE
+  v_user_ids integer[];
+  v_category_ids integer[];
+  v_amounts bigint[];
+  v_signs integer[];
 BEGIN
-  PERFORM refresh_jar_dashboard_data();
-  RETURN COALESCE(NEW, OLD);
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(user_id), array_agg(jar_category_id), array_agg(amount_cents), array_agg(1)
+    INTO v_user_ids, v_category_ids, v_amounts, v_signs
+    FROM new_rows r
+    WHERE NOT EXISTS (SELECT 1 FROM public.bulk_load_sessions b WHERE b.user_id = r.user_id);
+  ELSIF TG_OP = 'UPDATE' THEN
+    SELECT array_agg(user_id), array_agg(jar_category_id), array_agg(amount_cents), array_agg(sign)
+    INTO v_user_ids, v_category_ids, v_amounts, v_signs
+    FROM (
+      SELECT user_id, jar_category_id, amount_cents, 1 as sign FROM new_rows
+      UNION ALL
+      SELECT user_id, jar_category_id, amount_cents, -1 as sign FROM old_rows
+    ) changes
+    WHERE NOT EXISTS (SELECT 1 FROM public.bulk_load_sessions b WHERE b.user_id = changes.user_id);
+  ELSE
+    SELECT array_agg(user_id), array_agg(jar_category_id), array_agg(amount_cents), array_agg(-1)
+    INTO v_user_ids, v_category_ids, v_amounts, v_signs
+    FROM old_rows r
+    WHERE NOT EXISTS (SELECT 1 FROM public.bulk_load_sessions b WHERE b.user_id = r.user_id);
+  END IF;
+
+  IF v_user_ids IS NOT NULL THEN
+    PERFORM apply_transaction_changes(v_user_ids, v_category_ids, v_amounts, v_signs);
+  END IF;
+  RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
--- TRIGGER FUNCTION: Update tables when monthly income entries change
+-- TRIGGER FUNCTION: Rebuild the summary rows of the (user, month) pairs a statement touched
 CREATE OR REPLACE FUNCTION trigger_refresh_income_data()
 RETURNS trigger AS $$
+DECLARE
+  v_user_ids integer[];
+  v_months date[];
 BEGIN
-  PERFORM refresh_monthly_income_summary();
-  PERFORM refresh_jar_dashboard_data();
-  RETURN COALESCE(NEW, OLD);
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(user_id), array_agg(month_year) INTO v_user_ids, v_months
+    FROM new_rows r WHERE NOT EXISTS (SELECT 1 FROM public.bulk_load_sessions b WHERE b.user_id = r.user_id);
+  ELSIF TG_OP = 'UPDATE' THEN
+    SELECT array_agg(user_id), array_agg(month_year) INTO v_user_ids, v_months
+    FROM (SELECT user_id, month_year FROM new_rows UNION SELECT user_id, month_year FROM old_rows) changes
+    WHERE NOT EXISTS (SELECT 1 FROM public.bulk_load_sessions b WHERE b.user_id = changes.user_id);
+  ELSE
+    SELECT array_agg(user_id), array_agg(month_year) INTO v_user_ids, v_months
+    FROM old_rows r WHERE NOT EXISTS (SELECT 1 FROM public.bulk_load_sessions b WHERE b.user_id = r.user_id);
+  END IF;
+
+  IF v_user_ids IS NOT NULL THEN
+    PERFORM rebuild_monthly_income_summary(v_user_ids, v_months);
+  END IF;
+  RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
--- TRIGGER FUNCTION: Update tables when user jars change
+-- TRIGGER FUNCTION: Rebuild the balances of the (user, category) jars a statement touched
 CREATE OR REPLACE FUNCTION trigger_refresh_user_jar_data()
 RETURNS trigger AS $$
+DECLARE
+  v_user_ids integer[];
+  v_category_ids integer[];
 BEGIN
-  PERFORM refresh_jar_dashboard_data();
-  RETURN COALESCE(NEW, OLD);
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(user_id), array_agg(category_id) INTO v_user_ids, v_category_ids
+    FROM new_rows r WHERE NOT EXISTS (SELECT 1 FROM public.bulk_load_sessions b WHERE b.user_id = r.user_id);
+  ELSIF TG_OP = 'UPDATE' THEN
+    SELECT array_agg(user_id), array_agg(category_id) INTO v_user_ids, v_category_ids
+    FROM (SELECT user_id, category_id FROM new_rows UNION SELECT user_id, category_id FROM old_rows) changes
+    WHERE NOT EXISTS (SELECT 1 FROM public.bulk_load_sessions b WHERE b.user_id = changes.user_id);
+  ELSE
+    SELECT array_agg(user_id), array_agg(category_id) INTO v_user_ids, v_category_ids
+    FROM old_rows r WHERE NOT EXISTS (SELECT 1 FROM public.bulk_load_sessions b WHERE b.user_id = r.user_id);
+  END IF;
+
+  IF v_user_ids IS NOT NULL THEN
+    PERFORM rebuild_jar_balances(v_user_ids, v_category_ids);
+  END IF;
+  RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
--- Create triggers to automatically update tables
-CREATE TRIGGER transactions_refresh_trigger
-  AFTER INSERT OR UPDATE OR DELETE ON public.transactions
+-- Create triggers to keep the derived tables up to date. Transition tables are only
+-- allowed on single-event triggers, hence one trigger per event. Rows of users in
+-- bulk_load_sessions are skipped; end_bulk_load rebuilds them in one pass.
+DROP TRIGGER IF EXISTS transactions_refresh_trigger ON public.transactions;
+DROP TRIGGER IF EXISTS monthly_income_entries_refresh_trigger ON public.monthly_income_entries;
+DROP TRIGGER IF EXISTS user_jars_refresh_trigger ON public.user_jars;
+
+CREATE TRIGGER transactions_insert_refresh_trigger
+  AFTER INSERT ON public.transactions
+  REFERENCING NEW TABLE AS new_rows
   FOR EACH STATEMENT
   EXECUTE FUNCTION trigger_refresh_jar_data();
 
-CREATE TRIGGER monthly_income_entries_refresh_trigger
-  AFTER INSERT OR UPDATE OR DELETE ON public.monthly_income_entries
+CREATE TRIGGER transactions_update_refresh_trigger
+  AFTER UPDATE ON public.transactions
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION trigger_refresh_jar_data();
+
+CREATE TRIGGER transactions_delete_refresh_trigger
+  AFTER DELETE ON public.transactions
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION trigger_refresh_jar_data();
+
+CREATE TRIGGER monthly_income_entries_insert_refresh_trigger
+  AFTER INSERT ON public.monthly_income_entries
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION trigger_refresh_income_data();
+
+CREATE TRIGGER monthly_income_entries_update_refresh_trigger
+  AFTER UPDATE ON public.monthly_income_entries
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
   FOR EACH STATEMENT
   EXECUTE FUNCTION trigger_refresh_income_data();
 
-CREATE TRIGGER user_jars_refresh_trigger
-  AFTER INSERT OR UPDATE OR DELETE ON public.user_jars
+CREATE TRIGGER monthly_income_entries_delete_refresh_trigger
+  AFTER DELETE ON public.monthly_income_entries
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION trigger_refresh_income_data();
+
+CREATE TRIGGER user_jars_insert_refresh_trigger
+  AFTER INSERT ON public.user_jars
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION trigger_refresh_user_jar_data();
+
+CREATE TRIGGER user_jars_update_refresh_trigger
+  AFTER UPDATE ON public.user_jars
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION trigger_refresh_user_jar_data();
+
+CREATE TRIGGER user_jars_delete_refresh_trigger
+  AFTER DELETE ON public.user_jars
+  REFERENCING OLD TABLE AS old_rows
   FOR EACH STATEMENT
   EXECUTE FUNCTION trigger_refresh_user_jar_data();
 
+-- FUNCTION: Record a month's income and its jar allocations in one transaction (used by add_monthly_income)
+-- Existing databases: ALTER TABLE public.monthly_income_entries ADD COLUMN IF NOT EXISTS idempotency_key text;
+CREATE OR REPLACE FUNCTION allocate_monthly_income(
+  p_user_id integer,
+  p_month_year date,
+  p_total_income_cents bigint,
+  p_allocation_percentages jsonb,
+  p_description text,
+  p_idempotency_key text
+)
+RETURNS json AS $$
+DECLARE
+  v_entry public.monthly_income_entries;
+  v_count integer;
+BEGIN
+  -- Concurrent submissions for the same month wait here; only one inserts
+  INSERT INTO public.monthly_income_entries (user_id, month_year, total_income_cents, allocation_percentages, idempotency_key)
+  VALUES (p_user_id, p_month_year, p_total_income_cents, p_allocation_percentages, p_idempotency_key)
+  ON CONFLICT (user_id, month_year) DO NOTHING
+  RETURNING * INTO v_entry;
+
+  IF v_entry.id IS NULL THEN
+    SELECT * INTO v_entry FROM public.monthly_income_entries
+    WHERE user_id = p_user_id AND month_year = p_month_year;
+    RETURN json_build_object(
+      'status', CASE WHEN v_entry.idempotency_key = p_idempotency_key THEN 'duplicate' ELSE 'exists' END,
+      'entry_id', v_entry.id,
+      'transaction_count', 0
+    );
+  END IF;
+
+  INSERT INTO public.transactions (user_id, jar_category_id, amount_cents, description, source, monthly_income_entry_id)
+  SELECT p_user_id, jc.id, a.amount_cents, p_description, 'chatbot', v_entry.id
+  FROM public.jar_categories jc
+  CROSS JOIN LATERAL (
+    SELECT ROUND(p_total_income_cents * (p_allocation_percentages->>jc.name)::numeric / 100)::bigint AS amount_cents
+  ) a
+  WHERE (p_allocation_percentages->>jc.name) IS NOT NULL AND a.amount_cents > 0;
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+
+  RETURN json_build_object('status', 'created', 'entry_id', v_entry.id, 'transaction_count', v_count);
+END;
+$$ LANGUAGE plpgsql;
+
+-- FUNCTION: Planner estimate for a chatbot query (used by the backend SQL guard)
+-- EXPLAIN without ANALYZE only plans the query, it never runs it
+CREATE OR REPLACE FUNCTION explain_sql(query text)
+RETURNS json AS $$
+DECLARE
+  plan json;
+BEGIN
+  IF lower(ltrim(query)) NOT LIKE 'select%' AND lower(ltrim(query)) NOT LIKE 'with%' THEN
+    RAISE EXCEPTION 'Only SELECT queries can be explained';
+  END IF;
+  EXECUTE 'EXPLAIN (FORMAT JSON) ' || query INTO plan;
+  RETURN plan;
+END;
+$$ LANGUAGE plpgsql;
+
+-- FUNCTION: Savings balance and monthly net savings for one user (used by predict_savings)
+-- Served from idx_transactions_user_jar_date; the result has at most p_months rows of history
+CREATE OR REPLACE FUNCTION get_savings_summary(p_user_id integer, p_jar_category_id integer DEFAULT 6, p_months integer DEFAULT 120)
+RETURNS json AS $$
+  SELECT json_build_object(
+    'balance_cents', COALESCE(SUM(t.amount_cents), 0),
+    'transaction_count', COUNT(*),
+    'monthly', (
+      SELECT COALESCE(json_agg(json_build_object('month', m.month, 'net_cents', m.net_cents) ORDER BY m.month), '[]'::json)
+      FROM (
+        SELECT date_trunc('month', r.occurred_at)::date AS month, SUM(r.amount_cents) AS net_cents
+        FROM public.transactions r
+        WHERE r.user_id = p_user_id AND r.jar_category_id = p_jar_category_id
+          AND r.occurred_at >= date_trunc('month', now()) - make_interval(months => p_months)
+        GROUP BY 1
+      ) m
+    )
+  )
+  FROM public.transactions t
+  WHERE t.user_id = p_user_id AND t.jar_category_id = p_jar_category_id;
+$$ LANGUAGE sql STABLE;
+
 -- Indexes for performance
 CREATE INDEX idx_monthly_income_entries_user_month ON public.monthly_income_entries(user_id, month_year);
 CREATE INDEX idx_transactions_user_jar_date ON public.transactions(user_id, jar_category_id, occurred_at);